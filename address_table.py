@@ -0,0 +1,282 @@
+from array import array
+from bisect import bisect_right
+from collections import namedtuple
+from itertools import accumulate
+from typing import Iterable, Iterator, NamedTuple, Sequence
+
+ADDRESS_COLUMN_COUNT = 10
+# Dictionaries with more distinct strings than this, like streets, are stored as one utf-8 blob
+HEAP_MIN_VALUES = 1024
+# Rows read before their values are encoded, which bounds the memory of the plain values while reading
+ENCODE_CHUNK_ROWS = 65536
+
+
+# Record data format
+Address = namedtuple(
+    "Address", ["last_name1", "first_name1", "last_name2", "first_name2", "address1", "address2", "city", "state", "zip", "country"]
+)
+
+
+class SourceRows(NamedTuple):
+    """The rows of a table read from one input sheet or file. Empty sources have a first row past their last"""
+    name: str
+    first_row: int
+    last_row: int
+
+
+def _typecode(max_value: int) -> str:
+    """Returns the smallest unsigned array type that holds the value"""
+    for typecode in "BHIL":
+        if max_value < 1 << (8 * array(typecode).itemsize):
+            return typecode
+    return "Q"
+
+
+class StringHeap:
+    """
+    Read only list of strings stored as one utf-8 blob and the offsets into it
+    A str object costs around 50 bytes on top of its text, so this is much smaller for many distinct strings
+    Index 0 is None, the same as the dictionaries of the encoded columns
+    """
+
+    __slots__ = ("data", "offsets")
+
+    def __init__(self, values: Sequence[str]):
+        encoded = [value.encode() for value in values]
+        self.data = b"".join(encoded)
+        self.offsets = array(_typecode(len(self.data)), accumulate(map(len, encoded), initial=0))
+
+    def __getitem__(self, i: int) -> str | None:
+        if i == 0:
+            return None
+        return self.data[self.offsets[i - 1]:self.offsets[i]].decode()
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, StringHeap) and self.data == other.data and self.offsets == other.offsets
+
+
+class EncodedColumn:
+    """
+    Dictionary encoded column of a field. Each row is a code into the field's distinct values, in an array
+    Cities, states and countries repeat a lot, so most rows cost a byte or two instead of a pointer to their own string
+    Code 0 is always None, the empty value
+    """
+
+    __slots__ = ("codes", "values")
+
+    def __init__(self, codes: array, values: list | StringHeap):
+        self.codes = codes
+        self.values = values
+
+    @classmethod
+    def encode(cls, values: Iterable) -> "EncodedColumn":
+        """Encodes the values of a column"""
+        builder = _ColumnBuilder()
+        builder.extend(list(values))
+        return builder.finish()
+
+    def __getitem__(self, i: int):
+        return self.values[self.codes[i]]
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def __iter__(self) -> Iterator:
+        return map(self.values.__getitem__, self.codes)
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, EncodedColumn):
+            return NotImplemented
+        # Tables read from the same data have the same dictionaries, so only the codes are compared
+        if self.values == other.values:
+            return self.codes == other.codes
+        return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+
+    __hash__ = None
+
+
+class _ColumnBuilder:
+    """Encodes the values of a column a chunk at a time"""
+
+    def __init__(self):
+        self.lookup: dict = {None: 0}
+        self.values: list = [None]
+        self.codes = array("L")
+
+    def extend(self, values: Sequence):
+        """Appends a chunk of values. Only the distinct values are looked at one by one, the codes are mapped in bulk"""
+        lookup = self.lookup
+        for value in dict.fromkeys(values):
+            if value not in lookup:
+                lookup[value] = len(self.values)
+                self.values.append(value)
+        self.codes.extend(map(lookup.__getitem__, values))
+
+    def extend_encoded(self, column: EncodedColumn):
+        """Appends an encoded column, only looking up its distinct values and remapping its codes"""
+        lookup = self.lookup
+        remap = []
+        for i in range(len(column.values)):
+            value = column.values[i]
+            code = lookup.get(value)
+            if code is None:
+                code = lookup[value] = len(self.values)
+                self.values.append(value)
+            remap.append(code)
+        self.codes.extend(map(remap.__getitem__, column.codes))
+
+    def finish(self, length: int | None = None) -> EncodedColumn:
+        """Returns the column, cut to the length. The codes are narrowed to the smallest type for the dictionary"""
+        if length is not None:
+            del self.codes[length:]
+        codes = array(_typecode(len(self.values) - 1), self.codes)
+        values = self.values
+        if len(values) > HEAP_MIN_VALUES and all(isinstance(value, str) for value in values[1:]):
+            values = StringHeap(values[1:])
+        return EncodedColumn(codes, values)
+
+
+def _encode_chunk(builders: list[_ColumnBuilder], rows: list[tuple], columns: Sequence[int | None]) -> int:
+    """Appends a chunk of rows to the columns, transposed in bulk. Returns the count of non-empty rows"""
+    if not rows:
+        return 0
+    non_empty = sum(len(values) != values.count(None) for values in rows)
+    width = max((source + 1 for source in columns if source is not None), default=0)
+    if min(map(len, rows)) < width:
+        # Pad the short rows, so every source column is there
+        rows = [tuple(values) + (None,) * (width - len(values)) if len(values) < width else values for values in rows]
+    fields = list(zip(*rows)) if width else []
+    for builder, source in zip(builders, columns):
+        builder.extend(fields[source] if source is not None else [None] * len(rows))
+    return non_empty
+
+
+class AddressRow:
+    """
+    Lightweight view of a table row, with the same read API as an Address
+    The fields are decoded when they're read. It pickles as an Address, so it can be sent to worker processes
+    """
+
+    __slots__ = ("columns", "index")
+    _fields = Address._fields
+
+    def __init__(self, columns: list[EncodedColumn], index: int):
+        self.columns = columns
+        self.index = index
+
+    def __iter__(self) -> Iterator:
+        index = self.index
+        return (column[index] for column in self.columns)
+
+    def __getitem__(self, i: int):
+        return self.columns[i][self.index]
+
+    def __len__(self) -> int:
+        return ADDRESS_COLUMN_COUNT
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, (tuple, AddressRow)):
+            return NotImplemented
+        return tuple(self) == tuple(other)
+
+    def __hash__(self) -> int:
+        return hash(tuple(self))
+
+    def __repr__(self) -> str:
+        return repr(Address(*self))
+
+    def __reduce__(self):
+        return Address, tuple(self)
+
+    def _replace(self, **fields) -> Address:
+        return Address(*self)._replace(**fields)
+
+    def _asdict(self) -> dict:
+        return Address(*self)._asdict()
+
+
+# A property per field, like the namedtuple's
+for _i, _field in enumerate(Address._fields):
+    setattr(AddressRow, _field, property(lambda self, i=_i: self.columns[i][self.index]))
+
+
+class AddressTable:
+    """
+    Columnar in-memory table of the address fields, with each column dictionary encoded
+    Rows use the same 1 based indices as the spreadsheet, row 1 is the header
+    A table of several input sources has their rows one after another, the sources are where each one's rows are
+    """
+
+    def __init__(self, columns: list[EncodedColumn], max_row: int, sources: list[SourceRows] | None = None):
+        self.columns = columns
+        self.max_row = max_row
+        self.sources = sources or []
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[tuple], columns: Sequence[int | None] | None = None) -> "AddressTable":
+        """
+        Builds the table in a single pass over the row values, without the header
+        Columns is the source index of each Address field, None to leave the field empty
+        The max row is the header plus the count of non-empty rows, matching the old worksheet scan
+        """
+        if columns is None:
+            columns = range(ADDRESS_COLUMN_COUNT)
+        builders = [_ColumnBuilder() for _ in range(ADDRESS_COLUMN_COUNT)]
+        max_row = 1
+        chunk = []
+        for values in rows:
+            chunk.append(values)
+            if len(chunk) == ENCODE_CHUNK_ROWS:
+                max_row += _encode_chunk(builders, chunk, columns)
+                chunk = []
+        max_row += _encode_chunk(builders, chunk, columns)
+
+        # Drop the rows past the max row so they don't take up memory
+        return cls([builder.finish(max_row - 1) for builder in builders], max_row)
+
+    @classmethod
+    def concat(cls, tables: Sequence[tuple[str, "AddressTable"]]) -> "AddressTable":
+        """Joins the tables of named sources into one, in order. Their rows are numbered on from the one before"""
+        builders = [_ColumnBuilder() for _ in range(ADDRESS_COLUMN_COUNT)]
+        sources = []
+        max_row = 1
+        for name, table in tables:
+            for builder, column in zip(builders, table.columns):
+                builder.extend_encoded(column)
+            sources.append(SourceRows(name, max_row + 1, max_row + table.max_row - 1))
+            max_row += table.max_row - 1
+        return cls([builder.finish() for builder in builders], max_row, sources)
+
+    @classmethod
+    def empty(cls) -> "AddressTable":
+        """Returns a table with only a header row"""
+        return cls([EncodedColumn.encode([]) for _ in range(ADDRESS_COLUMN_COUNT)], 1)
+
+    def column(self, field: str) -> EncodedColumn:
+        """Returns the values of a field for rows 2 to max row"""
+        return self.columns[Address._fields.index(field)]
+
+    def get(self, row: int) -> AddressRow:
+        """Returns a view of the address record at the 1 based row index"""
+        if row < 2 or row > self.max_row:
+            raise ValueError(f"Row index: {row} out of bounds: 2-{self.max_row}")
+        return AddressRow(self.columns, row - 2)
+
+    def row_id(self, row: int) -> str:
+        """Returns how a row is shown: its number, or its source and the number in the source when there are several, like 'west:5'"""
+        if len(self.sources) < 2:
+            return str(row)
+        source = self.sources[max(0, bisect_right([source.first_row for source in self.sources], row) - 1)]
+        return f"{source.name}:{row - source.first_row + 2}"
+
+    def changed_rows(self, other: "AddressTable") -> list[int]:
+        """Returns the rows with different values in another table, which must have the same rows"""
+        changed = set()
+        for column, other_column in zip(self.columns, other.columns):
+            # Comparing whole columns is fast, so only the changed ones are walked
+            if column != other_column:
+                changed.update(i + 2 for i, (a, b) in enumerate(zip(column, other_column)) if a != b)
+        return sorted(changed)
@@ -0,0 +1,129 @@
+import json
+import time
+import tomllib
+from argparse import Namespace
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from address_table import AddressTable
+from label_generator import LabelGenerator
+from main import DEDUP_MODES, ENGINES
+from name_index import NameIndex
+
+# Options that decide how the input is loaded, so they're shared by every job
+INPUT_OPTIONS = ("input", "header", "columns", "cache")
+# Options that only make sense on the command line, they have no effect in a batch or watch job
+BATCH_OPTIONS = ("batch", "watch", "serve", "port", "check", "stats_json", "profile")
+CHOICES = {"engine": ENGINES, "dedup": DEDUP_MODES}
+
+# The generator of a worker process, loaded once and shared by every job it runs
+_worker_generator: LabelGenerator | None = None
+
+
+def load_manifest(path: Path) -> tuple[dict, list[dict]]:
+    """
+    Reads a JSON or TOML manifest. Returns the top level options and the list of jobs
+    The top level options apply to every job, like the command line options
+    """
+    path = Path(path)
+    if not path.is_file():
+        raise FileNotFoundError(f"Manifest file not found at: {path}")
+
+    if path.suffix.lower() == ".toml":
+        with open(path, "rb") as f:
+            manifest = tomllib.load(f)
+    elif path.suffix.lower() == ".json":
+        with open(path, "r") as f:
+            manifest = json.load(f)
+    else:
+        raise ValueError(f"Unsupported manifest type: {path.suffix}. Only .json or .toml files are supported.")
+
+    jobs = manifest.pop("jobs", None)
+    if not isinstance(jobs, list) or not jobs:
+        raise ValueError("The manifest needs a non-empty 'jobs' list")
+    return manifest, jobs
+
+
+def merge_options(args: Namespace, options: dict, where: str, allow_input: bool) -> Namespace:
+    """Returns the args updated with the options, checking every option is known and has the type of its default"""
+    merged = vars(args).copy()
+    for key, value in options.items():
+        if key not in merged:
+            raise ValueError(f"Unknown option '{key}' in {where}")
+        if key in BATCH_OPTIONS:
+            raise ValueError(f"Option '{key}' in {where} only works on the command line")
+        if key in INPUT_OPTIONS and not allow_input:
+            raise ValueError(f"Option '{key}' in {where} must be set at the top of the manifest, since the input is loaded once")
+        if type(value) is not type(merged[key]):
+            raise ValueError(f"Option '{key}' in {where} must be a {type(merged[key]).__name__}")
+        if key in CHOICES and value not in CHOICES[key]:
+            raise ValueError(f"Option '{key}' in {where} must be one of: {', '.join(CHOICES[key])}")
+        merged[key] = value
+    return Namespace(**merged)
+
+
+def _run_job(label_generator: LabelGenerator) -> tuple[int, int, float, str | None]:
+    """
+    Generates one job's PDF. Returns the label count, page count, seconds and error
+    A failed job returns its error instead of raising, so the other jobs still run
+    """
+    start = time.perf_counter()
+    try:
+        label_count, page_count = label_generator.generate_pdf()
+    except Exception as e:
+        print(f"Warning: Job for '{label_generator.args.output}' failed: {e}")
+        return 0, 0, time.perf_counter() - start, str(e)
+    return label_count, page_count, time.perf_counter() - start, None
+
+
+def _init_worker(args: Namespace, table: AddressTable, name_index: NameIndex):
+    """Keeps the loaded data in a worker process, so it's only sent once per worker"""
+    global _worker_generator
+    _worker_generator = LabelGenerator(args, table, name_index)
+
+
+def _run_job_in_worker(args: Namespace) -> tuple[int, int, float, str | None]:
+    return _run_job(_worker_generator.with_args(args))
+
+
+def run_batch(args: Namespace) -> int:
+    """
+    Runs every job of the manifest against the input, which is loaded only once
+    With args.jobs above 1, that many jobs run at once in worker processes
+    Returns the count of failed jobs, they're shown with their error in the summary
+    """
+    start = time.perf_counter()
+    options, jobs = load_manifest(args.batch)
+    base_args = merge_options(args, options, "the manifest", allow_input=True)
+    job_args = [merge_options(base_args, job, f"job {i + 1}", allow_input=False) for i, job in enumerate(jobs)]
+
+    label_generator = LabelGenerator(base_args)
+    load_seconds = time.perf_counter() - start
+    print(f"Loaded '{base_args.input}' in {load_seconds:.2f}s")
+
+    if args.jobs > 1:
+        # Each job renders serially, the jobs themselves are parallel
+        for job in job_args:
+            job.jobs = 1
+        with ProcessPoolExecutor(
+            max_workers=args.jobs,
+            initializer=_init_worker,
+            initargs=(base_args, label_generator.table, label_generator.name_index),
+        ) as executor:
+            results = list(executor.map(_run_job_in_worker, job_args))
+    else:
+        results = [_run_job(label_generator.with_args(job)) for job in job_args]
+
+    print()
+    print(f"{'Job':<5}{'Output':<30}{'Labels':>8}{'Pages':>8}{'Seconds':>10}")
+    for i, (job, (label_count, page_count, seconds, error)) in enumerate(zip(job_args, results)):
+        if error is None:
+            print(f"{i + 1:<5}{job.output:<30}{label_count:>8}{page_count:>8}{seconds:>10.2f}")
+        else:
+            print(f"{i + 1:<5}{job.output:<30}{'failed':>16}{seconds:>10.2f}  {error}")
+    total_labels = sum(r[0] for r in results)
+    total_pages = sum(r[1] for r in results)
+    print(f"{'':<5}{'Total':<30}{total_labels:>8}{total_pages:>8}{time.perf_counter() - start:>10.2f}")
+    failed = sum(r[3] is not None for r in results)
+    if failed:
+        print(f"{failed} of {len(results)} job(s) failed")
+    return failed
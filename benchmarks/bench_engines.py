@@ -0,0 +1,49 @@
+"""
+Compares the pylabels and canvas rendering engines
+Run from the repo root: python -m benchmarks.bench_engines --rows 5000
+"""
+
+import argparse
+import contextlib
+import io
+import tempfile
+import time
+from pathlib import Path
+from benchmarks.synthetic import write_addresses
+from main import get_args, ENGINES
+from label_generator import LabelGenerator
+
+
+def time_engine(input_path: Path, output_path: Path, engine: str) -> tuple[float, int]:
+    """Returns the seconds to render every row with an engine, and the label count"""
+    args = get_args(True)
+    args.input = str(input_path)
+    args.output = str(output_path)
+    args.engine = engine
+    label_generator = LabelGenerator(args)
+    indices, name_idx = label_generator._filter_indices()
+    sheet = label_generator._create_sheet()
+
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        label_generator._save_pdf(sheet, indices, name_idx)
+    return time.perf_counter() - start, sheet.label_count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compares the labels per second of the rendering engines")
+    parser.add_argument("--rows", type=int, default=3000)
+    bench_args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        input_path = Path(tmp) / "addresses.xlsx"
+        write_addresses(input_path, bench_args.rows)
+        for engine in ENGINES:
+            output_path = Path(tmp) / f"{engine}.pdf"
+            seconds, labels = time_engine(input_path, output_path, engine)
+            size = output_path.stat().st_size
+            print(f"{engine:>10}: {labels} labels in {seconds:.2f}s, {labels / seconds:,.0f} labels/s, {size:,} bytes")
+
+
+if __name__ == "__main__":
+    main()
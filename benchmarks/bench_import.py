@@ -0,0 +1,91 @@
+"""
+Checks the import time of the entry points against a budget, so startup regressions are caught
+Exits with an error if a module is over its budget or imports one of the slow libraries it shouldn't
+Run from the repo root: python -m benchmarks.bench_import
+"""
+
+import argparse
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+# Libraries that are slow to import and only needed once a stage runs
+SLOW_LIBRARIES = ("openpyxl", "reportlab", "pylabels", "pypdf")
+
+# (module, budget in ms, modules it must not import)
+CHECKS = [
+    ("main", 60, SLOW_LIBRARIES + ("label_generator",)),
+    ("label_generator", 120, SLOW_LIBRARIES),
+    ("batch", 150, SLOW_LIBRARIES),
+    ("serve", 150, SLOW_LIBRARIES),
+    # Needs customtkinter, which is skipped if it's not installed
+    ("label_generator_app", 600, SLOW_LIBRARIES),
+]
+# Runs of each check, the fastest is kept
+RUNS = 5
+
+
+def import_time(module: str, forbidden: tuple[str, ...]) -> tuple[float, list[str]] | None:
+    """
+    Returns the ms to import a module in a fresh interpreter, with the forbidden modules it imported
+    Returns None if one of its dependencies isn't installed
+    """
+    code = f"import sys, {module}; print(' '.join(m for m in {forbidden!r} if m in sys.modules))"
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=ROOT, capture_output=True, text=True)
+    if result.returncode != 0:
+        if "ModuleNotFoundError" in result.stderr:
+            return None
+        raise RuntimeError(result.stderr)
+
+    # The cumulative microseconds of the module itself, from lines like 'import time: self | cumulative | name'
+    for line in result.stderr.splitlines():
+        parts = line.split("|")
+        if len(parts) == 3 and parts[2].rstrip() == f" {module}":
+            return int(parts[1]) / 1000, result.stdout.split()
+    raise RuntimeError(f"No import time found for {module}")
+
+
+def wall_time(args: list[str]) -> float:
+    """Returns the ms to run a command in a fresh interpreter"""
+    start = time.perf_counter()
+    subprocess.run([sys.executable, *args], cwd=ROOT, capture_output=True, check=True)
+    return (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Checks the import time of the entry points against a budget")
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiplies every budget, for slow machines")
+    bench_args = parser.parse_args()
+
+    failed = False
+    print(f"{'Module':<22}{'Import ms':>10}{'Budget ms':>10}  Result")
+    for module, budget, forbidden in CHECKS:
+        budget *= bench_args.scale
+        runs = [import_time(module, forbidden) for _ in range(RUNS)]
+        if runs[0] is None:
+            print(f"{module:<22}{'':>10}{budget:>10.0f}  skipped, a dependency isn't installed")
+            continue
+        ms = min(run[0] for run in runs)
+        imported = runs[0][1]
+
+        result = "ok"
+        if ms > budget:
+            result = "over budget"
+        if imported:
+            result = f"imported {', '.join(imported)}"
+        failed |= result != "ok"
+        print(f"{module:<22}{ms:>10.1f}{budget:>10.0f}  {result}")
+
+    # The whole command, including the interpreter starting
+    bare = min(wall_time(["-c", "pass"]) for _ in range(RUNS))
+    help = min(wall_time(["main.py", "-h"]) for _ in range(RUNS))
+    print(f"\n'main.py -h' takes {help:.0f}ms, {help - bare:.0f}ms more than starting python")
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Load tests the label server with concurrent clients, and reports requests/s and the latency percentiles
+Run from the repo root: python -m benchmarks.bench_serve --requests 200 --clients 8 --workers 4
+Point it at a running server with --url http://127.0.0.1:8766
+"""
+
+import argparse
+import json
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from benchmarks.synthetic import generate_rows
+
+# Seconds to wait for a started server to answer /health
+STARTUP_TIMEOUT = 60
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_until_up(url: str, server: subprocess.Popen | None = None):
+    """Polls /health until the server answers"""
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        if server is not None and server.poll() is not None:
+            raise RuntimeError(f"The server exited with status {server.returncode}")
+        try:
+            with urllib.request.urlopen(f"{url}/health", timeout=1):
+                return
+        except (urllib.error.URLError, OSError):
+            time.sleep(0.1)
+    raise RuntimeError(f"The server didn't start within {STARTUP_TIMEOUT}s")
+
+
+def request_bodies(count: int, labels: int, engine: str) -> list[bytes]:
+    """Returns request bodies of different synthetic addresses, so the workers' caches don't hide the rendering"""
+    rows = generate_rows(count * labels, blanks=0, missing=0, invalid=0)
+    bodies = []
+    for _ in range(count):
+        addresses = [next(rows) for _ in range(labels)]
+        bodies.append(json.dumps({"addresses": addresses, "options": {"engine": engine}}).encode())
+    return bodies
+
+
+def send(url: str, body: bytes) -> tuple[float, int]:
+    """Returns the seconds until the whole PDF is read, and its size"""
+    request = urllib.request.Request(f"{url}/labels", data=body, headers={"Content-Type": "application/json"})
+    start = time.perf_counter()
+    with urllib.request.urlopen(request) as response:
+        size = len(response.read())
+    return time.perf_counter() - start, size
+
+
+def percentile(values: list[float], p: float) -> float:
+    """Returns the p-th percentile of the values, by the nearest rank"""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(p / 100 * len(ordered)) - 1))]
+
+
+def run_load(url: str, bodies: list[bytes], clients: int) -> dict:
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        # A few requests first so every worker has imported the libraries and laid out a label
+        list(executor.map(lambda body: send(url, body), bodies[:clients]))
+        bodies = bodies[clients:]
+        start = time.perf_counter()
+        results = list(executor.map(lambda body: send(url, body), bodies))
+        seconds = time.perf_counter() - start
+
+    latencies = [latency for latency, _ in results]
+    return {
+        "requests": len(bodies),
+        "clients": clients,
+        "seconds": seconds,
+        "requests_per_second": len(bodies) / seconds,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "max_ms": max(latencies) * 1000,
+        "mean_pdf_bytes": statistics.mean(size for _, size in results),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load tests the label server")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--clients", type=int, default=8, help="Requests sent at once")
+    parser.add_argument("--labels", type=int, default=30, help="Addresses in each request")
+    parser.add_argument("--workers", type=int, default=2, help="Worker processes of the started server")
+    parser.add_argument("--engine", default="canvas")
+    parser.add_argument("--url", help="Test a running server instead of starting one")
+    parser.add_argument("--json", help="Write the results to a json file")
+    bench_args = parser.parse_args()
+
+    bodies = request_bodies(bench_args.requests + bench_args.clients, bench_args.labels, bench_args.engine)
+    server = None
+    url = bench_args.url
+    if url is None:
+        port = free_port()
+        url = f"http://127.0.0.1:{port}"
+        server = subprocess.Popen(
+            [sys.executable, "main.py", "--serve", "--port", str(port), "-j", str(bench_args.workers)],
+            stdout=subprocess.DEVNULL,
+        )
+    try:
+        wait_until_up(url, server)
+        results = run_load(url, bodies, bench_args.clients)
+    finally:
+        if server is not None:
+            # Like Ctrl+C, so the server shuts its worker processes down
+            if sys.platform == "win32":
+                server.terminate()
+            else:
+                server.send_signal(signal.SIGINT)
+            server.wait()
+
+    results.update(labels=bench_args.labels, workers=None if bench_args.url else bench_args.workers, engine=bench_args.engine)
+    print(
+        f"{results['requests']} requests of {results['labels']} labels from {results['clients']} clients: "
+        f"{results['requests_per_second']:,.1f} requests/s, p50 {results['p50_ms']:.1f}ms, "
+        f"p99 {results['p99_ms']:.1f}ms, max {results['max_ms']:.1f}ms"
+    )
+    if bench_args.json:
+        with open(bench_args.json, "w") as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
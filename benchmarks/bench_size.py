@@ -0,0 +1,74 @@
+"""
+Tracks the PDF size and write time as the label count grows, with and without --compact
+Run from the repo root: python -m benchmarks.bench_size --labels 1000,10000,50000 --json size.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import time
+from benchmarks.synthetic import generate_rows
+from main import get_args, ENGINES
+from label_generator import LabelGenerator
+
+
+def measure(rows: list[list], engine: str, compact: bool, test: bool) -> dict:
+    """Returns the size and seconds of writing the rows as labels to memory"""
+    args = get_args(True)
+    args.engine = engine
+    args.compact = compact
+    args.test = test
+    label_generator = LabelGenerator.from_addresses(args, rows)
+    stream = io.BytesIO()
+
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        labels, pages = label_generator.generate_pdf(stream)
+    seconds = time.perf_counter() - start
+
+    size = len(stream.getvalue())
+    return {
+        "engine": engine,
+        "compact": compact,
+        "test": test,
+        "labels": labels,
+        "pages": pages,
+        "bytes": size,
+        "bytes_per_page": size / max(1, pages),
+        "seconds": seconds,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tracks the PDF size and write time as the label count grows")
+    parser.add_argument("--labels", default="1000,5000,20000", help="Comma separated label counts")
+    parser.add_argument("--engines", default="canvas", help=f"Comma separated engines of: {', '.join(ENGINES)}")
+    parser.add_argument("--test", action="store_true", help="Draw the label borders too")
+    parser.add_argument("--json", help="Write the results to a json file")
+    bench_args = parser.parse_args()
+
+    counts = [int(count) for count in bench_args.labels.split(",")]
+    engines = [engine.strip() for engine in bench_args.engines.split(",")]
+    # The same rows for every run, and none are skipped so the label counts match
+    all_rows = list(generate_rows(max(counts), blanks=0, missing=0, invalid=0))
+
+    results = []
+    print(f"{'engine':>10} {'compact':>8} {'labels':>8} {'pages':>6} {'bytes':>12} {'bytes/page':>11} {'seconds':>8}")
+    for engine in engines:
+        for count in counts:
+            for compact in (False, True):
+                result = measure(all_rows[:count], engine, compact, bench_args.test)
+                results.append(result)
+                print(
+                    f"{engine:>10} {str(compact):>8} {result['labels']:>8} {result['pages']:>6} {result['bytes']:>12,} "
+                    f"{result['bytes_per_page']:>11,.0f} {result['seconds']:>8.2f}"
+                )
+
+    if bench_args.json:
+        with open(bench_args.json, "w") as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
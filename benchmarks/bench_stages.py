@@ -0,0 +1,233 @@
+"""
+Times each stage of generating labels from a synthetic address file
+Run from the repo root: python -m benchmarks.bench_stages --rows 100000 --json results.json
+Compare two runs with: python -m benchmarks.bench_stages --compare old.json new.json
+Memory is the peak resident memory of the process, or the peak allocations of each stage with --trace-memory
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable
+from benchmarks.synthetic import add_arguments, last_names, synthetic_options, write_addresses
+from main import get_args, ENGINES
+from label_generator import LabelGenerator
+from name_index import NameIndex
+from readers import read_addresses
+from workbook_cache import WorkbookCache
+
+try:
+    import resource
+except ImportError:
+    # Not on Windows
+    resource = None
+
+# The count kinds a stage can report a rate for
+RATES = ("rows", "labels", "pages")
+
+
+def max_rss_bytes() -> int | None:
+    """Returns the peak resident memory of the process so far, if it's known"""
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+class StageTimer:
+    """Runs and records the stages. Stage results are plain dicts so they can be written as JSON"""
+
+    def __init__(self, trace_memory: bool = False):
+        self.trace_memory = trace_memory
+        self.stages: list[dict] = []
+
+    def run(self, name: str, func: Callable, **counts: int):
+        """Runs a stage quietly and returns its result. The counts are rows, labels or pages"""
+        if self.trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()) as output:
+            result = func()
+        seconds = time.perf_counter() - start
+        peak = None
+        if self.trace_memory:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+        self.stages.append({
+            "stage": name,
+            "seconds": seconds,
+            "warnings": output.getvalue().count("Warning:"),
+            "peak_traced_bytes": peak,
+            "max_rss_bytes": max_rss_bytes(),
+            **counts,
+        })
+        return result
+
+    def count(self, **counts: int):
+        """Sets counts of the last stage that were only known after it ran"""
+        self.stages[-1].update(counts)
+
+    def results(self) -> list[dict]:
+        """Returns the stages with the per second rate of each count"""
+        for stage in self.stages:
+            for kind in RATES:
+                if kind in stage:
+                    stage[f"{kind}_per_second"] = stage[kind] / stage["seconds"] if stage["seconds"] else None
+        return self.stages
+
+
+def representative_filters(max_row: int, common: str, rare: str) -> dict[str, str]:
+    """Returns named filters that exercise the wildcard, ranges, names, prefixes, typos and removals"""
+    return {
+        "all": "*",
+        "ranges": f"2-{max_row // 2}, !{max_row // 4}-{max_row // 3}, {max_row}",
+        "common_name": common,
+        "rare_name": f"mary {rare}",
+        "prefix": f"{common[:3]}*",
+        "fuzzy": f"~{rare[:-1]}",
+        "mixed": f"*, !{common}, mary {common}, !2-{max(2, max_row // 10)}",
+    }
+
+
+def run_stages(input_path: Path, work_dir: Path, engines: list[str], timer: StageTimer, names: list[str]):
+    """Times reading, indexing, caching, filtering, layout and rendering of the input"""
+    args = get_args(True)
+    args.input = str(input_path)
+    args.cache = False
+
+    # Load
+    table = timer.run("read", lambda: read_addresses(input_path))
+    rows = table.max_row - 1
+    timer.count(rows=rows)
+    name_index = timer.run("name_index", lambda: NameIndex(table), rows=rows)
+
+    cache = WorkbookCache(work_dir / "cache")
+    key = timer.run("cache_key", lambda: cache.key(input_path), rows=rows)
+    timer.run("cache_store", lambda: cache.store(key, table, name_index), rows=rows)
+    timer.run("cache_load", lambda: cache.load(key), rows=rows)
+
+    # Filter
+    label_generator = LabelGenerator(args, table, name_index)
+    filters = representative_filters(table.max_row, names[0].lower(), names[-1].lower())
+    for name, filter in filters.items():
+        args.filter = filter
+        timer.run(f"filter:{name}", label_generator.with_args(args)._filter_indices, rows=rows)
+
+    # Layout every row once, on a generator without cached layouts
+    args.filter = "*"
+    layout_generator = LabelGenerator(args, table, name_index)
+    width, height = layout_generator._label_area(layout_generator._create_specification())
+    indices, name_idx = layout_generator._filter_indices()
+
+    def layout() -> int:
+        """Lays out the valid rows, the same ones that are rendered. Returns their count"""
+        count = 0
+        for address, _ in layout_generator._iter_labels(indices, name_idx):
+            formatted = layout_generator._format_address(address)
+            if formatted is not None:
+                layout_generator._layout_text(formatted[0], width, height)
+                count += 1
+        return count
+
+    labels = timer.run("layout", layout)
+    timer.count(labels=labels, distinct_labels=len(layout_generator.layouts))
+
+    # Render with each engine, placing the labels and saving separately
+    for engine in engines:
+        args.engine = engine
+        engine_generator = LabelGenerator(args, table, name_index)
+        sheet = engine_generator._create_sheet()
+
+        def place():
+            for address, count in engine_generator._iter_labels(indices, name_idx):
+                sheet.add_label(address, count=count)
+
+        timer.run(f"place:{engine}", place)
+        timer.count(labels=sheet.label_count, pages=sheet.page_count)
+        output_path = work_dir / f"{engine}.pdf"
+        timer.run(f"save:{engine}", lambda: sheet.save(str(output_path)), labels=sheet.label_count, pages=sheet.page_count)
+        timer.count(output_bytes=output_path.stat().st_size)
+
+
+def print_results(stages: list[dict]):
+    """Prints the stages as a table"""
+    print(f"{'Stage':<20}{'Seconds':>10}{'Rows/s':>14}{'Labels/s':>14}{'Pages/s':>12}{'Mem MB':>10}{'Warnings':>10}")
+    for stage in stages:
+        rates = [stage.get(f"{kind}_per_second") for kind in RATES]
+        rates = [f"{rate:,.0f}" if rate else "" for rate in rates]
+        peak = stage["peak_traced_bytes"] or stage["max_rss_bytes"]
+        peak = f"{peak / 2**20:,.1f}" if peak else ""
+        print(f"{stage['stage']:<20}{stage['seconds']:>10.3f}{rates[0]:>14}{rates[1]:>14}{rates[2]:>12}{peak:>10}{stage['warnings']:>10}")
+
+
+def compare(old_path: Path, new_path: Path):
+    """Prints the seconds of each stage in two result files and the ratio of new to old"""
+    with open(old_path) as f:
+        old = {stage["stage"]: stage for stage in json.load(f)["stages"]}
+    with open(new_path) as f:
+        new = json.load(f)["stages"]
+
+    print(f"{'Stage':<20}{'Old s':>10}{'New s':>10}{'Ratio':>8}")
+    for stage in new:
+        before = old.get(stage["stage"])
+        if before is None:
+            print(f"{stage['stage']:<20}{'':>10}{stage['seconds']:>10.3f}")
+            continue
+        ratio = stage["seconds"] / before["seconds"] if before["seconds"] else float("inf")
+        print(f"{stage['stage']:<20}{before['seconds']:>10.3f}{stage['seconds']:>10.3f}{ratio:>7.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Times each stage of generating labels from synthetic addresses")
+    add_arguments(parser)
+    parser.add_argument("--format", choices=("xlsx", "csv", "tsv"), default="xlsx")
+    parser.add_argument("--engines", nargs="+", choices=ENGINES, default=list(ENGINES))
+    parser.add_argument("--trace-memory", action="store_true", help="Record the peak allocations of each stage, slows the stages down")
+    parser.add_argument("--json", help="Write the results to a json file")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="Compare two json result files instead of running")
+    bench_args = parser.parse_args()
+
+    if bench_args.compare:
+        compare(*map(Path, bench_args.compare))
+        return
+
+    options = synthetic_options(bench_args)
+    timer = StageTimer(bench_args.trace_memory)
+    with tempfile.TemporaryDirectory() as tmp:
+        input_path = Path(tmp) / f"addresses.{bench_args.format}"
+        start = time.perf_counter()
+        write_addresses(input_path, bench_args.rows, **options)
+        print(f"Wrote {bench_args.rows:,} rows in {time.perf_counter() - start:.1f}s")
+        run_stages(input_path, Path(tmp), bench_args.engines, timer, last_names(bench_args.names))
+
+    stages = timer.results()
+    print_results(stages)
+    if bench_args.json:
+        results = {
+            "meta": {
+                "time": datetime.now(timezone.utc).isoformat(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "rows": bench_args.rows,
+                "format": bench_args.format,
+                "trace_memory": bench_args.trace_memory,
+                **options,
+            },
+            "stages": stages,
+        }
+        with open(bench_args.json, "w") as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+Writes synthetic address files for the benchmarks
+Run from the repo root: python -m benchmarks.synthetic addresses.xlsx --rows 100000
+"""
+
+import argparse
+import csv
+import itertools
+import random
+from pathlib import Path
+from typing import Iterator
+from openpyxl import Workbook
+
+HEADER = ["LastName1", "FirstName1", "LastName2", "FirstName2", "Address1", "Address2", "City", "State", "Zip", "Country"]
+SYLLABLES = ["an", "ber", "car", "den", "el", "fin", "gar", "hol", "is", "jen", "kal", "lo", "mar", "nor", "os", "per", "ros", "son", "ter", "vin"]
+FIRST_NAMES = ["Mary", "John", "Ava", "Liam", "Olivia", "Ben", "Sarah", "Noah", "Emma", "Lucas", "Mia", "Ethan", "Zoe", "Omar", "Li", "Ana"]
+STREETS = ["Maple St", "Oak Ave", "Pine Rd", "Cedar Ln", "Elm Dr", "Lakeview Blvd", "Hillcrest Ct", "Sunset Way"]
+CITIES = [("Austin", "TX"), ("Miami", "FL"), ("Portland", "OR"), ("Springfield", "IL"), ("Denver", "CO"), ("Albany", "NY")]
+COUNTRIES = ["Canada", "Mexico", "United Kingdom", "Germany"]
+# A street that is too long for a label at the normal font size
+LONG_STREET = "12345 North Saint Lawrence Boulevard Apartment Building C Unit 1024"
+
+
+def last_names(count: int) -> list[str]:
+    """Returns count distinct made up last names"""
+    names = []
+    for length in itertools.count(2):
+        for parts in itertools.product(SYLLABLES, repeat=length):
+            names.append("".join(parts).capitalize())
+            if len(names) == count:
+                return names
+    return names
+
+
+def generate_rows(
+    rows: int,
+    names: int = 1000,
+    skew: float = 1.0,
+    duplicates: float = 0.02,
+    blanks: float = 0.01,
+    missing: float = 0.02,
+    invalid: float = 0.005,
+    long: float = 0.01,
+    foreign: float = 0.05,
+    seed: int = 0,
+) -> Iterator[list]:
+    """
+    Yields rows of random addresses, without the header
+    Last names follow a Zipf distribution with the skew as the exponent, so a few names are very common
+    The fractions of rows that are duplicates of an earlier row, blank, missing an address field,
+    missing a last name, too long or in another country can be set to hit the warning branches
+    """
+    rng = random.Random(seed)
+    pool = last_names(names)
+    weights = list(itertools.accumulate(1 / (rank ** skew) for rank in range(1, len(pool) + 1)))
+    previous = []
+
+    for _ in range(rows):
+        roll = rng.random()
+        if roll < blanks:
+            yield [None] * len(HEADER)
+            continue
+        if roll < blanks + duplicates and previous:
+            yield list(rng.choice(previous))
+            continue
+
+        city, state = rng.choice(CITIES)
+        last = rng.choices(pool, cum_weights=weights)[0]
+        row = [
+            last,
+            rng.choice(FIRST_NAMES),
+            rng.choice([None, None, last, rng.choice(pool)]),
+            rng.choice([None, rng.choice(FIRST_NAMES)]),
+            LONG_STREET if rng.random() < long else f"{rng.randint(1, 9999)} {rng.choice(STREETS)}",
+            rng.choice([None] * 9 + [f"PO Box {rng.randint(1, 999)}"]),
+            city,
+            state,
+            rng.randint(10000, 99999),
+            rng.choice(COUNTRIES) if rng.random() < foreign else None,
+        ]
+        if rng.random() < missing:
+            # City, state, zip or the street
+            row[rng.choice([4, 6, 7, 8])] = None
+        if rng.random() < invalid:
+            row[0] = None
+
+        # Only the first rows are copied, so duplicates use a bounded memory
+        if len(previous) < 1000:
+            previous.append(row)
+        yield row
+
+
+def write_addresses(path: Path, rows: int, **kwargs):
+    """Writes random addresses to an .xlsx, .csv or .tsv file, by its suffix. Keyword args go to generate_rows"""
+    path = Path(path)
+    suffix = path.suffix.lower()
+    data = generate_rows(rows, **kwargs)
+    if suffix == ".xlsx":
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet()
+        ws.append(HEADER)
+        for row in data:
+            ws.append(row)
+        wb.save(path)
+    elif suffix in (".csv", ".tsv"):
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f, delimiter="\t" if suffix == ".tsv" else ",")
+            writer.writerow(HEADER)
+            for row in data:
+                writer.writerow(["" if value is None else value for value in row])
+    else:
+        raise ValueError(f"Unsupported file type: {path.suffix}. Only .xlsx, .csv or .tsv files are supported.")
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    """Adds the synthetic data options to a parser"""
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--names", type=int, default=1000, help="Count of distinct last names")
+    parser.add_argument("--skew", type=float, default=1.0, help="Zipf exponent of the last names, 0 is uniform")
+    parser.add_argument("--duplicates", type=float, default=0.02, help="Fraction of rows copied from an earlier row")
+    parser.add_argument("--blanks", type=float, default=0.01, help="Fraction of blank rows")
+    parser.add_argument("--missing", type=float, default=0.02, help="Fraction of rows missing an address field")
+    parser.add_argument("--invalid", type=float, default=0.005, help="Fraction of rows without a last name")
+    parser.add_argument("--long", type=float, default=0.01, help="Fraction of rows too long for a label")
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def synthetic_options(args: argparse.Namespace) -> dict:
+    """Returns the generate_rows keyword args from parsed options"""
+    return dict(
+        names=args.names,
+        skew=args.skew,
+        duplicates=args.duplicates,
+        blanks=args.blanks,
+        missing=args.missing,
+        invalid=args.invalid,
+        long=args.long,
+        seed=args.seed,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Writes a synthetic address file")
+    parser.add_argument("output", help="An .xlsx, .csv or .tsv file")
+    add_arguments(parser)
+    args = parser.parse_args()
+    write_addresses(Path(args.output), args.rows, **synthetic_options(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+import math
+from contextlib import contextmanager
+from decimal import Decimal
+from itertools import islice
+from typing import Callable, Iterator
+from pylabels import Specification
+from reportlab import rl_config
+from reportlab.lib import colors
+from reportlab.lib.units import mm
+from reportlab.pdfgen.canvas import Canvas
+
+# The specification values are Decimals, same as pylabels
+mm = Decimal(mm)
+
+# Form names of the compact border, for one label and for every label on a page
+LABEL_BORDER_FORM = "label_border"
+PAGE_BORDER_FORM = "page_border"
+
+
+@contextmanager
+def binary_streams():
+    """
+    Writes the PDF streams as plain compressed binary while saving, instead of ascii85 encoding them too
+    The ascii85 text is a quarter bigger, and reportlab only reads the setting when the document is saved
+    """
+    use_a85 = rl_config.useA85
+    rl_config.useA85 = 0
+    try:
+        yield
+    finally:
+        rl_config.useA85 = use_a85
+
+
+class CanvasSheet:
+    """
+    Renders labels straight onto a reportlab canvas, page by page
+    Has the same add_label/save interface as pylabels.Sheet, without building a Drawing per label
+    """
+
+    def __init__(
+        self,
+        specification: Specification,
+        drawing_callable: Callable,
+        border: bool = False,
+        border_color=None,
+        border_width: float = 1,
+        compact: bool = False,
+    ):
+        """
+        The drawing callable is given the canvas, the width and height of the available area and the object
+        The canvas origin is the bottom left of the available area and it's clipped to it
+        If compact, the PDF is written for size: binary streams, the borders drawn once as shared forms,
+        and only the graphics state each label needs
+        """
+        self.specs = specification
+        self.drawing_callable = drawing_callable
+        self.border = border
+        self.border_color = border_color or colors.black
+        self.border_width = border_width
+        self.compact = compact
+
+        # Labels to draw, as (object, count)
+        self._labels: list[tuple[object, int]] = []
+        self.label_count = 0
+        self.page_count = 0
+
+        # Label and available area sizes in points
+        self._lw = float(self.specs.label_width * mm)
+        self._lh = float(self.specs.label_height * mm)
+        self._cr = float(self.specs.corner_radius * mm)
+        self._dw = float((self.specs.label_width - self.specs.left_padding - self.specs.right_padding) * mm)
+        self._dh = float((self.specs.label_height - self.specs.top_padding - self.specs.bottom_padding) * mm)
+        self._lp = float(self.specs.left_padding * mm)
+        self._bp = float(self.specs.bottom_padding * mm)
+        self._pr = float(self.specs.padding_radius * mm)
+        self._pagesize = (float(self.specs.sheet_width * mm), float(self.specs.sheet_height * mm))
+        self.slots = self._calculate_slots()
+
+    def _calculate_slots(self) -> list[tuple[float, float]]:
+        """Returns the bottom left corner of every label on a page, in the order they are filled"""
+        slots = []
+        for row in range(1, self.specs.rows + 1):
+            for column in range(1, self.specs.columns + 1):
+                left = self.specs.left_margin
+                left += self.specs.label_width * (column - 1)
+                if self.specs.column_gap:
+                    left += self.specs.column_gap * (column - 1)
+
+                bottom = self.specs.sheet_height - self.specs.top_margin
+                bottom -= self.specs.label_height * row
+                if self.specs.row_gap:
+                    bottom -= self.specs.row_gap * (row - 1)
+                slots.append((float(left * mm), float(bottom * mm)))
+        return slots
+
+    def add_label(self, obj, count: int = 1):
+        """Queues count copies of a label, it's drawn when the sheet is saved"""
+        self._labels.append((obj, count))
+        self.label_count += count
+        # Ceiling division, the same as the pages pylabels would start
+        self.page_count = -(-self.label_count // len(self.slots))
+
+    def iter_labels(self) -> Iterator:
+        """Lazily yields every label object in order, repeating the copies"""
+        for obj, count in self._labels:
+            for _ in range(count):
+                yield obj
+
+    def _rect_path(self, canvas: Canvas, width: float, height: float, radius: float):
+        """Returns a rectangle path with rounded corners if there is a radius"""
+        path = canvas.beginPath()
+        if radius:
+            path.roundRect(0, 0, width, height, radius)
+        else:
+            path.rect(0, 0, width, height)
+        return path
+
+    def _drawing_inside_label(self) -> bool:
+        """
+        Returns if the available area is inside the label's rounded corners, so clipping to it also clips to the label
+        Each rounded rectangle is its corner circle centers' rectangle grown by the radius
+        """
+        specs = self.specs
+        for x_padding, y_padding in (
+            (specs.left_padding, specs.bottom_padding),
+            (specs.left_padding, specs.top_padding),
+            (specs.right_padding, specs.bottom_padding),
+            (specs.right_padding, specs.top_padding),
+        ):
+            x_padding, y_padding = float(x_padding * mm), float(y_padding * mm)
+            gap = math.hypot(max(0.0, self._cr - x_padding - self._pr), max(0.0, self._cr - y_padding - self._pr))
+            if x_padding < 0 or y_padding < 0 or gap > self._cr - self._pr:
+                return False
+        return True
+
+    def _begin_border_forms(self, canvas: Canvas, label_path):
+        """Defines the border of a label and of a full page as forms, so each is only in the PDF once"""
+        canvas.beginForm(LABEL_BORDER_FORM)
+        canvas.setLineWidth(self.border_width)
+        canvas.setStrokeColor(self.border_color)
+        # Clipped like the full size border, so the stroke is the same width
+        canvas.clipPath(label_path, stroke=0, fill=0)
+        canvas.drawPath(label_path, stroke=1, fill=0)
+        canvas.endForm()
+
+        canvas.beginForm(PAGE_BORDER_FORM)
+        for left, bottom in self.slots:
+            canvas.saveState()
+            canvas.translate(left, bottom)
+            canvas.doForm(LABEL_BORDER_FORM)
+            canvas.restoreState()
+        canvas.endForm()
+
+    def _save_compact(self, canvas: Canvas, on_page: Callable[[int], None] | None):
+        """Draws every label with the least PDF operators, see save"""
+        label_path = self._rect_path(canvas, self._lw, self._lh, self._cr)
+        drawing_path = self._rect_path(canvas, self._dw, self._dh, self._pr)
+        clip_label = not self._drawing_inside_label()
+        if self.border:
+            self._begin_border_forms(canvas, label_path)
+
+        labels = self.iter_labels()
+        while page := list(islice(labels, len(self.slots))):
+            full = len(page) == len(self.slots)
+            if self.border and full:
+                canvas.doForm(PAGE_BORDER_FORM)
+            for (left, bottom), obj in zip(self.slots, page):
+                # The last page only has borders around its labels, like the full size save
+                if self.border and not full:
+                    canvas.saveState()
+                    canvas.translate(left, bottom)
+                    canvas.doForm(LABEL_BORDER_FORM)
+                    canvas.restoreState()
+                if obj is None:
+                    continue
+                canvas.saveState()
+                if clip_label:
+                    canvas.translate(left, bottom)
+                    canvas.clipPath(label_path, stroke=0, fill=0)
+                    canvas.translate(self._lp, self._bp)
+                else:
+                    canvas.translate(left + self._lp, bottom + self._bp)
+                canvas.clipPath(drawing_path, stroke=0, fill=0)
+                self.drawing_callable(canvas, self._dw, self._dh, obj)
+                canvas.restoreState()
+            canvas.showPage()
+            if on_page:
+                on_page(canvas.getPageNumber() - 1)
+        with binary_streams():
+            canvas.save()
+
+    def save(self, filelike, on_page: Callable[[int], None] | None = None):
+        """
+        Draws every label and saves the PDF to a path or file-like object
+        On page is called with the count of pages drawn after each page, if it's given
+        """
+        canvas = Canvas(filelike, pagesize=self._pagesize, pageCompression=1 if self.compact else None)
+        canvas.setViewerPreference("PrintScaling", "None")
+        if self.compact:
+            self._save_compact(canvas, on_page)
+            return
+
+        label_path = self._rect_path(canvas, self._lw, self._lh, self._cr)
+        drawing_path = self._rect_path(canvas, self._dw, self._dh, self._pr)
+
+        labels = self.iter_labels()
+        while page := list(islice(labels, len(self.slots))):
+            # The graphics state is reset on every page
+            canvas.setLineWidth(self.border_width)
+            canvas.setStrokeColor(self.border_color)
+            for (left, bottom), obj in zip(self.slots, page):
+                # Blank labels only need their border
+                if obj is None and not self.border:
+                    continue
+                canvas.saveState()
+                canvas.translate(left, bottom)
+                canvas.clipPath(label_path, stroke=0, fill=0)
+
+                canvas.saveState()
+                canvas.translate(self._lp, self._bp)
+                canvas.clipPath(drawing_path, stroke=0, fill=0)
+                self.drawing_callable(canvas, self._dw, self._dh, obj)
+                canvas.restoreState()
+
+                if self.border:
+                    canvas.drawPath(label_path, stroke=1, fill=0)
+                canvas.restoreState()
+            canvas.showPage()
+            if on_page:
+                on_page(canvas.getPageNumber() - 1)
+        canvas.save()
@@ -0,0 +1,185 @@
+import re
+from typing import NamedTuple
+from address_table import Address, AddressTable
+from filter_engine import RowSet
+
+# Common USPS street suffixes, directions and units, so 'Main Street' and 'Main St.' are the same
+STREET_ABBREVIATIONS = {
+    "STREET": "ST",
+    "AVENUE": "AVE",
+    "AV": "AVE",
+    "ROAD": "RD",
+    "DRIVE": "DR",
+    "LANE": "LN",
+    "BOULEVARD": "BLVD",
+    "COURT": "CT",
+    "PLACE": "PL",
+    "CIRCLE": "CIR",
+    "TERRACE": "TER",
+    "PARKWAY": "PKWY",
+    "HIGHWAY": "HWY",
+    "SQUARE": "SQ",
+    "TRAIL": "TRL",
+    "NORTH": "N",
+    "SOUTH": "S",
+    "EAST": "E",
+    "WEST": "W",
+    "APARTMENT": "APT",
+    "SUITE": "STE",
+}
+# 'P.O. Box', 'PO Box' and 'Post Office Box'
+PO_BOX = re.compile(r"\b(?:P ?O|POST OFFICE) BOX\b")
+# 5 digit ZIP codes, with an optional +4. Spreadsheets drop the leading zeros of ZIP codes stored as numbers
+ZIP = re.compile(r"(\d{1,5})(?:-?\d{4})?")
+
+# Dropped, or split into words
+PUNCTUATION = str.maketrans({".": None, "'": None, ",": " ", "#": " "})
+
+DUPLICATE = "duplicate"
+HOUSEHOLD = "household"
+
+
+class Merge(NamedTuple):
+    row: int
+    merged_row: int
+    kind: str
+
+
+class Dedup(NamedTuple):
+    indices: RowSet
+    # The new address of the kept rows that a household or a fuller duplicate was merged into
+    addresses: dict[int, Address]
+    merges: list[Merge]
+
+
+def _normalize(value) -> str:
+    """Uppercases and collapses the whitespace and punctuation of a field"""
+    if value is None:
+        return ""
+    return " ".join(str(value).upper().translate(PUNCTUATION).split())
+
+
+def _normalize_street(value) -> str:
+    words = PO_BOX.sub("PO BOX", _normalize(value)).split()
+    return " ".join(STREET_ABBREVIATIONS.get(word, word) for word in words)
+
+
+def _normalize_zip(value) -> str:
+    """Returns the 5 digit ZIP code without the +4, or the normalized postcode if it's not a US one"""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    text = _normalize(value)
+    match = ZIP.fullmatch(text)
+    if match is None:
+        return text
+    return match.group(1).zfill(5)
+
+
+# The fields of where an address is, and how each is normalized into the hash key
+KEY_FIELDS = (
+    ("address1", _normalize_street),
+    ("address2", _normalize_street),
+    ("city", _normalize),
+    ("state", _normalize),
+    ("zip", _normalize_zip),
+    ("country", _normalize),
+)
+
+
+def _address_keys(table: AddressTable, rows: list[int]) -> list[tuple[str, ...]]:
+    """
+    Returns the hash key of where each row is, the same for every way of writing the address
+    Built a column at a time. Values like cities repeat a lot, so each distinct one is normalized once
+    """
+    columns = []
+    for field, normalize in KEY_FIELDS:
+        column = table.column(field)
+        values = [column[row - 2] for row in rows]
+        normalized = {value: normalize(value) for value in set(values)}
+        columns.append([normalized[value] for value in values])
+    return list(zip(*columns))
+
+
+def _people(address: Address) -> frozenset[tuple[str, str]]:
+    """Returns the (first, last) names on an address, the second person shares the first last name if they don't have one"""
+    people = {(_normalize(address.first_name1), _normalize(address.last_name1))}
+    if address.first_name2 or address.last_name2:
+        people.add((_normalize(address.first_name2), _normalize(address.last_name2 or address.last_name1)))
+    return frozenset(people)
+
+
+def _is_single(address: Address) -> bool:
+    """Returns if an address is one person, not a company or a couple"""
+    return bool(address.first_name1) and not address.first_name2 and not address.last_name2
+
+
+def _merge_household(address: Address, other: Address) -> Address:
+    """Adds the person of another address as the second name, in the 'John & Mary Miller' format if they share a last name"""
+    last_name2 = None if _normalize(other.last_name1) == _normalize(address.last_name1) else other.last_name1
+    return address._replace(first_name2=other.first_name1, last_name2=last_name2)
+
+
+def deduplicate(table: AddressTable, indices: RowSet, households: bool = False) -> Dedup:
+    """
+    Collapses the rows with the same people at the same address, in one pass over the rows after the keys are hashed
+    The first row is kept, and takes the names of a later duplicate that has more people on it. Kept rows it then covers are merged into it
+    If households, two single people at the same address are merged into one label
+    Rows without a last name or street are left for _iter_labels to skip
+    """
+    # The kept rows at each address
+    kept: dict[tuple[str, ...], list[int]] = {}
+    people: dict[int, frozenset[tuple[str, str]]] = {}
+    addresses: dict[int, Address] = {}
+    merges = []
+    rows = []
+    # Kept rows that a later row widened another kept row to cover
+    collapsed = set()
+
+    def widen(other: int, at_address: list[int]):
+        """Collapses the other kept rows at the address whose people are all on the widened row now"""
+        for kept_row in [kept_row for kept_row in at_address if kept_row != other and people[kept_row] <= people[other]]:
+            at_address.remove(kept_row)
+            addresses.pop(kept_row, None)
+            collapsed.add(kept_row)
+            merges.append(Merge(other, kept_row, DUPLICATE))
+
+    last_names = table.column("last_name1")
+    streets = table.column("address1")
+    selected = [row for row in indices if last_names[row - 2] and streets[row - 2]]
+    keys = dict(zip(selected, _address_keys(table, selected)))
+
+    for row in indices:
+        key = keys.get(row)
+        if key is None:
+            rows.append(row)
+            continue
+
+        address = table.get(row)
+        row_people = _people(address)
+        at_address = kept.setdefault(key, [])
+        for other in at_address:
+            if row_people <= people[other]:
+                merges.append(Merge(other, row, DUPLICATE))
+                break
+            if people[other] < row_people:
+                # Like 'John Miller', then 'John & Mary Miller'
+                addresses[other] = address
+                people[other] = row_people
+                merges.append(Merge(other, row, DUPLICATE))
+                widen(other, at_address)
+                break
+            other_address = addresses.get(other) or table.get(other)
+            if households and _is_single(address) and _is_single(other_address):
+                addresses[other] = _merge_household(other_address, address)
+                people[other] = people[other] | row_people
+                merges.append(Merge(other, row, HOUSEHOLD))
+                widen(other, at_address)
+                break
+        else:
+            at_address.append(row)
+            people[row] = row_people
+            rows.append(row)
+
+    if collapsed:
+        rows = [row for row in rows if row not in collapsed]
+    return Dedup(RowSet.from_rows(rows), addresses, merges)
@@ -0,0 +1,284 @@
+from bisect import bisect_right
+from typing import Iterable, Iterator, NamedTuple, Sequence
+from address_table import SourceRows
+from name_index import NameIndex, parse_name_part
+
+# Kinds of compiled filter terms
+ALL = "all"
+NAME = "name"
+ROWS = "rows"
+
+# Distinct terms the preview keeps the rows of, before starting over
+PREVIEW_CACHE_SIZE = 256
+
+
+class RowSet:
+    """A set of row indices stored as sorted, disjoint and inclusive intervals"""
+
+    __slots__ = ("intervals",)
+
+    def __init__(self, intervals: list[tuple[int, int]] | None = None):
+        self.intervals = intervals if intervals is not None else []
+
+    @classmethod
+    def from_range(cls, start: int, end: int) -> "RowSet":
+        """Returns the rows from start to end inclusive"""
+        if start > end:
+            return cls()
+        return cls([(start, end)])
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[int]) -> "RowSet":
+        """Returns the rows coalesced into intervals"""
+        intervals = []
+        for row in sorted(rows):
+            if intervals and row <= intervals[-1][1] + 1:
+                start, end = intervals[-1]
+                intervals[-1] = (start, max(end, row))
+            else:
+                intervals.append((row, row))
+        return cls(intervals)
+
+    def __len__(self) -> int:
+        return sum(end - start + 1 for start, end in self.intervals)
+
+    def __bool__(self) -> bool:
+        return bool(self.intervals)
+
+    def __iter__(self) -> Iterator[int]:
+        """Lazily yields the rows in sorted order"""
+        for start, end in self.intervals:
+            yield from range(start, end + 1)
+
+    def __contains__(self, row: int) -> bool:
+        i = bisect_right(self.intervals, (row, float("inf"))) - 1
+        return i >= 0 and self.intervals[i][1] >= row
+
+    def union(self, other: "RowSet") -> "RowSet":
+        """Returns the rows in either set, merging overlapping or touching intervals"""
+        intervals = []
+        # Sorting the two sorted runs is a single merge pass in C
+        for start, end in sorted(self.intervals + other.intervals):
+            if intervals and start <= intervals[-1][1] + 1:
+                if end > intervals[-1][1]:
+                    intervals[-1] = (intervals[-1][0], end)
+            else:
+                intervals.append((start, end))
+        return RowSet(intervals)
+
+    def difference(self, other: "RowSet") -> "RowSet":
+        """Returns the rows in this set that are not in the other"""
+        intervals = []
+        removed = other.intervals
+        j = 0
+        for start, end in self.intervals:
+            # Skip removed intervals that end before this one
+            while j < len(removed) and removed[j][1] < start:
+                j += 1
+            k = j
+            cur = start
+            while k < len(removed) and removed[k][0] <= end:
+                r_start, r_end = removed[k]
+                if r_start > cur:
+                    intervals.append((cur, r_start - 1))
+                cur = max(cur, r_end + 1)
+                k += 1
+            if cur <= end:
+                intervals.append((cur, end))
+        return RowSet(intervals)
+
+
+def format_filter(f: str) -> tuple[str, bool] | None:
+    """Returns a single filter as (string, invert), or None if it's empty"""
+    invert = False
+    f = f.strip()
+    if not f:
+        return None
+    if f.startswith("!"):
+        invert = True
+        f = f[1:]
+    if not f:
+        raise ValueError("Invalid filter: dangling '!'")
+    return f, invert
+
+
+def split_and_format_filters(filter: str) -> list[tuple[str, bool]]:
+    """Returns a list of filters: (string, invert). Split on ','"""
+    filters = []
+    for f in filter.split(","):
+        formatted = format_filter(f)
+        if formatted is not None:
+            filters.append(formatted)
+    return filters
+
+
+def match_index_or_range(filter: str, max_row: int) -> RowSet:
+    """Determines if filter is index or range and returns the matched indices"""
+    # Filter is a range
+    if "-" in filter:
+        parts = filter.split("-")
+        if len(parts) != 2 or not parts[0].strip().isdigit() or not parts[1].strip().isdigit():
+            raise ValueError(f"Invalid index range: {filter}")
+        start, end = map(int, (parts[0], parts[1]))
+        if start < 2 or start > max_row or end < 2 or end > max_row:
+            raise ValueError(f"Invalid index: {filter}, out of bounds {2}-{max_row}")
+        if start > end:
+            raise ValueError(f"Invalid range: start > end in {filter}")
+        return RowSet.from_range(start, end)
+
+    # Filter is single number
+    num = int(filter)
+    if num < 2 or num > max_row:
+        raise ValueError(f"Invalid index: {filter}, out of bounds {2}-{max_row}")
+    return RowSet.from_range(num, num)
+
+
+def match_source_rows(filter: str, sources: Sequence[SourceRows]) -> RowSet:
+    """Returns the rows of a source filter like 'west:4-9' or 'west:*', numbered in the source like its sheet"""
+    name, _, rows = (x.strip() for x in filter.partition(":"))
+    source = next((source for source in sources if source.name.lower() == name.lower()), None)
+    if source is None:
+        names = ", ".join(source.name for source in sources) or "none"
+        raise ValueError(f"Unknown source: '{name}' in {filter}. Sources are: {names}")
+    if rows == "*":
+        return RowSet.from_range(source.first_row, source.last_row)
+    if not rows or not all(c.isdigit() or c == "-" for c in rows):
+        raise ValueError(f"Not a valid source filter: {filter}. Use rows like '{name}:4-9' or '{name}:*'")
+
+    offset = source.first_row - 2
+    try:
+        local = match_index_or_range(rows, source.last_row - offset)
+    except ValueError as e:
+        raise ValueError(f"{e} in source '{source.name}'")
+    return RowSet([(start + offset, end + offset) for start, end in local.intervals])
+
+
+def compile_term(f: str, invert: bool, max_row: int, sources: Sequence[SourceRows] = ()) -> tuple[str, bool, str | RowSet | None]:
+    """Parses a single formatted filter into a (kind, invert, value) term"""
+    # Filter is wildcard
+    if f == "*":
+        return ALL, invert, None
+
+    # Filter is rows of one input source
+    if ":" in f:
+        return ROWS, invert, match_source_rows(f, sources)
+
+    # Filter is a name, with exact, prefix or fuzzy parts
+    if all(c.isalpha() or c.isspace() or c in "*~" for c in f):
+        for part in f.split():
+            parse_name_part(part)
+        return NAME, invert, f
+
+    # Filter is number or number range
+    if all(c.isdigit() or c == "-" for c in f):
+        return ROWS, invert, match_index_or_range(f, max_row)
+
+    # Not a valid filter
+    raise ValueError(f"Not a valid filter: {f}")
+
+
+def term_rows(term: tuple[str, bool, str | RowSet | None], max_row: int, name_index: NameIndex) -> RowSet:
+    """Returns the rows a compiled term matches, before its invert is applied"""
+    kind, _, value = term
+    if kind == ALL:
+        return RowSet.from_range(2, max_row)
+    if kind == NAME:
+        return RowSet.from_rows(name_index.match_sorted(value))
+    return value
+
+
+class CompiledFilter:
+    """
+    A filter string parsed and validated once into a list of terms
+    Each term is (kind, invert, value), where value is the name for NAME terms
+    and the matched rows for ROWS terms
+    """
+
+    def __init__(self, terms: list[tuple[str, bool, str | RowSet | None]], max_row: int):
+        self.terms = terms
+        self.max_row = max_row
+
+    @classmethod
+    def compile(cls, filter: str, max_row: int, sources: Sequence[SourceRows] = ()) -> "CompiledFilter":
+        """Parses a filter string like '*, !5-20, !john, 15, west:4-9'. The sources are the ones of the table"""
+        terms = [compile_term(f, invert, max_row, sources) for f, invert in split_and_format_filters(filter)]
+        return cls(terms, max_row)
+
+    def evaluate(self, name_index: NameIndex) -> RowSet:
+        """Applies the terms in order and returns the selected rows"""
+        indices = RowSet()
+        for term in self.terms:
+            kind, invert, value = term
+            nums = term_rows(term, self.max_row, name_index)
+            if kind == NAME:
+                print(f"Matched name: '{value}', {len(nums)} times")
+
+            # Update the indices based on the invert
+            if invert:
+                indices = indices.difference(nums)
+            else:
+                indices = indices.union(nums)
+        return indices
+
+
+class FilterPreview(NamedTuple):
+    """The result of previewing a filter. Terms are (filter, matched count), errors are the invalid filters"""
+
+    rows: RowSet
+    terms: list[tuple[str, int]]
+    errors: list[str]
+
+
+class IncrementalFilter:
+    """
+    Evaluates a filter over and over as it's edited, only redoing the terms that changed
+    Each distinct term is cached, and so are the running rows of the leading terms that
+    are the same as the last filter, so typing at the end only evaluates the last term
+    Invalid terms are reported instead of raised, and left out of the rows
+    """
+
+    def __init__(self, name_index: NameIndex, max_row: int, sources: Sequence[SourceRows] = ()):
+        self.name_index = name_index
+        self.max_row = max_row
+        self.sources = sources
+        # (invert, rows, row count) or the error message, by the filter string
+        self._terms: dict[str, tuple[bool, RowSet, int] | str] = {}
+        # (filter, running rows) for each term of the last filter
+        self._prefix: list[tuple[str, RowSet]] = []
+
+    def _term(self, f: str) -> tuple[bool, RowSet, int] | str:
+        """Returns the invert, rows and row count of a single filter, or the error message if it's invalid"""
+        term = self._terms.get(f)
+        if term is None:
+            if len(self._terms) >= PREVIEW_CACHE_SIZE:
+                self._terms.clear()
+            try:
+                f_str, invert = format_filter(f)
+                rows = term_rows(compile_term(f_str, invert, self.max_row, self.sources), self.max_row, self.name_index)
+                term = invert, rows, len(rows)
+            except ValueError as e:
+                term = str(e)
+            self._terms[f] = term
+        return term
+
+    def evaluate(self, filter: str) -> FilterPreview:
+        """Returns the selected rows, the count of each term and the errors"""
+        parts = [f.strip() for f in filter.split(",") if f.strip()]
+        terms = [self._term(f) for f in parts]
+
+        # Reuse the running rows of the unchanged leading terms
+        same = 0
+        while same < min(len(parts), len(self._prefix)) and self._prefix[same][0] == parts[same]:
+            same += 1
+        del self._prefix[same:]
+
+        indices = self._prefix[-1][1] if self._prefix else RowSet()
+        for f, term in zip(parts[same:], terms[same:]):
+            if not isinstance(term, str):
+                invert, rows, _ = term
+                indices = indices.difference(rows) if invert else indices.union(rows)
+            self._prefix.append((f, indices))
+
+        counts = [(f, term[2]) for f, term in zip(parts, terms) if not isinstance(term, str)]
+        errors = [term for term in terms if isinstance(term, str)]
+        return FilterPreview(indices, counts, errors)
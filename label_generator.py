@@ -1,179 +1,220 @@
 
+from __future__ import annotations
 from argparse import Namespace
-import webbrowser
-from openpyxl import load_workbook
-from openpyxl.worksheet.worksheet import Worksheet
+import os
+import threading
+from contextlib import contextmanager
+from itertools import repeat
+from typing import TYPE_CHECKING, BinaryIO, Callable, Iterable, Iterator, Sequence
 from pathlib import Path
-from pylabels import Sheet, Specification
-from collections import namedtuple
-from reportlab.graphics import shapes
+from address_table import ADDRESS_COLUMN_COUNT, Address, AddressRow, AddressTable
+from name_index import NameIndex
+from filter_engine import CompiledFilter, RowSet
+from readers import InputSource, input_sources, read_sources
+from stats import RunStats
+
+# The rendering and PDF libraries are slow to import, so they're imported by the stages that use them
+if TYPE_CHECKING:
+    from pylabels import Sheet, Specification
+    from pypdf import PdfWriter
+    from canvas_sheet import CanvasSheet
+    from label_templates import LabelTemplateCache
+    from text_layout import TextLayout
 
 # Pylabels2 docs example: https://github.com/erikvw/pylabels2/blob/main/pylabels/demos/addresses.py
 
-ADDRESS_COLUMN_COUNT = 10
+# Chunks of pages to split the labels into per parallel job
+CHUNKS_PER_JOB = 4
+# Identical objects are only found once the objects they reference are merged, so each pass shares one more level:
+# the fonts, the font list, the label border form, then the page border form
+MERGE_PASSES = 4
+# Labels placed between progress reports
+PROGRESS_LABELS = 100
 
+# Progress stages, reported as (stage, done, total). The total is 0 when it's unknown
+STAGE_READ = "read"
+STAGE_FILTER = "filter"
+STAGE_PLACE = "place"
+STAGE_WRITE = "write"
 
-# Record data format
-Address = namedtuple(
-    "Address", ["last_name1", "first_name1", "last_name2", "first_name2", "address1", "address2", "city", "state", "zip", "country"]
-)
+
+class GenerationCancelled(Exception):
+    """Raised when the cancel event is set while generating"""
 
 
 class LabelGenerator:
-    def __init__(self, args: Namespace):
-        """Setup and load data"""
+    def __init__(
+        self,
+        args: Namespace,
+        table: AddressTable | None = None,
+        name_index: NameIndex | None = None,
+        progress: Callable[[str, int, int], None] | None = None,
+        cancel: threading.Event | None = None,
+        stats: RunStats | None = None,
+    ):
+        """
+        Setup and load data, unless an already loaded table is given
+        Progress is called as (stage, done, total) while loading and saving
+        Setting the cancel event stops at the next progress report with GenerationCancelled
+        The time, allocations and counts of each stage are recorded in the stats
+        """
         self.args = args
-        self.ws = self._load_worksheet()
-        self.max_row = self._find_max_row()
-
-    def _load_worksheet(self) -> Worksheet:
-        """Loads an Excel file and returns the first Worksheet"""
-        path = Path(self.args.input)
-        if not path.is_file():
-            raise FileNotFoundError(f"Input file not found at: {path}")
-
-        if path.suffix.lower() != ".xlsx":
-            raise ValueError(f"Unsupported file type: {path.suffix}. Only .xls or .xlsx files are supported.")
-
-        wb = load_workbook(path)
-        return wb.active
-
-    def _find_max_row(self) -> int:
-        """Finds the max row that is not empty, since ws.max_row counts empty rows"""
-        count = 0
-        for row in self.ws:
-            if any(cell.value is not None for cell in row):
-                count += 1
-        return count
-
-    def _get_address(self, row: int) -> Address:
+        self.progress = progress
+        self.cancel = cancel
+        self.stats = stats or RunStats()
+        if table is None:
+            with self.stats.stage("load") as stage:
+                self.table, self.name_index = self._load_input()
+                stage["rows"] = self.table.max_row - 1
+        else:
+            self.table, self.name_index = table, name_index or NameIndex(table)
+        self.max_row = self.table.max_row
+        # The addresses that households or duplicates were merged into, replacing their rows
+        self.merged_addresses: dict[int, Address] = {}
+        # Keyed by (lines, shrink) so generators with other args can share them. Created when the first label is drawn
+        self.templates: LabelTemplateCache | None = None
+        self.layouts: dict[tuple[tuple[str, ...], bool], TextLayout] = {}
+
+    @classmethod
+    def from_addresses(
+        cls,
+        args: Namespace,
+        addresses: Iterable[Sequence | dict],
+        progress: Callable[[str, int, int], None] | None = None,
+        cancel: threading.Event | None = None,
+        stats: RunStats | None = None,
+    ) -> "LabelGenerator":
+        """
+        Returns a generator for address records that are already loaded, instead of the input file
+        A record is a sequence of the Address fields in order, like an Address, or a dict of them
+        The records are numbered from row 2, like a sheet with a header, for the filter and return address
+        """
+        return cls(args, AddressTable.from_rows(map(_address_values, addresses)), progress=progress, cancel=cancel, stats=stats)
+
+    def with_args(
+        self,
+        args: Namespace,
+        progress: Callable[[str, int, int], None] | None = None,
+        cancel: threading.Event | None = None,
+    ) -> "LabelGenerator":
+        """
+        Returns a generator for other args, sharing the loaded data and the label caches
+        The progress and cancel event are this generator's unless they're given
+        """
+        label_generator = LabelGenerator(args, self.table, self.name_index, progress or self.progress, cancel or self.cancel)
+        label_generator.templates = self._template_cache()
+        label_generator.layouts = self.layouts
+        return label_generator
+
+    def _report(self, stage: str, done: int, total: int = 0):
+        """Reports progress and raises GenerationCancelled if the cancel event is set"""
+        if self.cancel is not None and self.cancel.is_set():
+            raise GenerationCancelled("Generation cancelled")
+        if self.progress is not None:
+            self.progress(stage, done, total)
+
+    def _load_input(self) -> tuple[AddressTable, NameIndex]:
+        """Returns the address table and name index of the input sources, from the workbook cache if they're unchanged"""
+        sources = input_sources(self.args.input)
+
+        if not self.args.cache:
+            table = self._load_table(sources)
+            self._print_sources(table)
+            return table, NameIndex(table)
+
+        from workbook_cache import WorkbookCache
+
+        cache = WorkbookCache()
+        # The header and column options change how the same files are parsed, and the sheets which rows are read
+        sheets = [(source.name, source.sheet) for source in sources]
+        key = cache.key([source.path for source in sources], f"{self.args.header}|{self.args.columns}|{sheets}")
+        cached = cache.load(key)
+        if cached is not None:
+            self.stats.count("cache_hits")
+            table, name_index = cached
+        else:
+            self.stats.count("cache_misses")
+            table = self._load_table(sources)
+            name_index = NameIndex(table)
+            cache.store(key, table, name_index)
+        self._print_sources(table)
+        return table, name_index
+
+    def _print_sources(self, table: AddressTable):
+        """Prints the row count of each source, when there are several to pick from in the filter"""
+        if len(table.sources) > 1:
+            print("Sources: " + ", ".join(f"{source.name} ({source.last_row - source.first_row + 1} rows)" for source in table.sources))
+
+    def _load_table(self, sources: list[InputSource]) -> AddressTable:
+        """Streams the input sources into one address table, several at once with --jobs"""
+        return read_sources(sources, self.args.header, self.args.columns, self.args.jobs, progress=lambda rows: self._report(STAGE_READ, rows))
+
+    def _get_address(self, row: int) -> Address | AddressRow:
         """Returns a address record from the data at the 1 based row index"""
-        if row < 2 or row > self.max_row:
-            raise ValueError(f"Row index: {row} out of bounds: 2-{self.max_row}")
-        values = [
-            self.ws.cell(row=row, column=col).value
-            for col in range(1, ADDRESS_COLUMN_COUNT + 1)
-        ]
-        return Address(*values)
-
-    def _split_and_format_filters(self) -> list[tuple[str, bool]]:
-        """Returns a list of filters: (string, invert). Split on ','"""
-        f_strs = self.args.filter.split(",")
-        filters = []
-        for f in f_strs:
-            invert = False
-            f = f.strip()
-            if not f:
-                continue
-            if f.startswith("!"):
-                invert = True
-                f = f[1:]
-            if not f:
-                raise ValueError("Invalid filter: dangling '!'")
-            filters.append((f, invert))
-        return filters
+        merged = self.merged_addresses.get(row)
+        if merged is not None:
+            return merged
+        return self.table.get(row)
 
     def _match_name(self, filter: str) -> set[int]:
         """
         Returns a set of all indices matched in the name fields
         All parts in the split input filter, must match an address name field
         """
-        filter_parts = [x.strip().lower() for x in filter.split()]
-        indices = set()
-        for i in range(2, self.max_row + 1):
-            address = self._get_address(i)
-            # Address name fields if they exist
-            address_parts = {
-                x.strip().lower()
-                for x in (
-                    address.last_name1,
-                    address.first_name1,
-                    address.last_name2,
-                    address.first_name2,
-                )
-                if x}
-            if all(a in address_parts for a in filter_parts):
-                indices.add(i)
-        return indices
-
-    def _match_index_or_range(self, filter: str) -> set[int]:
-        """Determines if filter is index or range and returns set of the matched indices"""
-        # Filter is a range
-        if "-" in filter:
-            parts = filter.split("-")
-            if len(parts) != 2 or not parts[0].strip().isdigit() or not parts[1].strip().isdigit():
-                raise ValueError(f"Invalid index range: {filter}")
-            start, end = map(int, (parts[0], parts[1]))
-            if start < 2 or start > self.max_row or end < 2 or end > self.max_row:
-                raise ValueError(f"Invalid index: {filter}, out of bounds {2}-{self.max_row}")
-            if start > end:
-                raise ValueError(f"Invalid range: start > end in {filter}")
-            return set(range(start, end + 1))
-
-        # Filter is single number
-        num = int(filter)
-        if num < 2 or num > self.max_row:
-            raise ValueError(f"Invalid index: {filter}, out of bounds {2}-{self.max_row}")
-        return {num}
-
-    def _filter_indices(self) -> tuple[set[int], int]:
+        return self.name_index.match(filter)
+
+    def find_name_row(self, name: str) -> int:
+        """Returns the row of the return address, which must be the only row that matches the name"""
+        match_nums = self._match_name(name)
+        if len(match_nums) == 0:
+            raise ValueError(f"Name: '{name}' not found. This is needed for the return address")
+        if len(match_nums) > 1:
+            raise ValueError(f"Name: '{name}' found multiple times. There can only be one for the return address")
+        return match_nums.pop()
+
+    def _filter_indices(self) -> tuple[RowSet, int]:
         """
         Finds all matched indices from the filter argument
         Also removes the name input arg
-        Returns the set of matched indices and the name index
+        Returns the matched indices and the name index
         """
-        filters = self._split_and_format_filters()
-        # Result indices to return
-        indices = set()
-        for filter, invert in filters:
-            # Set of nums to either add to or remove from indices
-            nums = set()
-
-            # Filter is wildcard
-            if filter == "*":
-                nums.update(range(2, self.max_row + 1))
-
-            # Filter is a name
-            elif all(c.isalpha() or c.isspace() for c in filter):
-                match_nums = self._match_name(filter)
-                nums.update(match_nums)
-                print(f"Matched name: '{filter}', {len(match_nums)} times")
-
-            # Filter is number or number range
-            elif all(c.isdigit() or c == "-" for c in filter):
-                match_nums = self._match_index_or_range(filter)
-                nums.update(match_nums)
-
-            # Not a valid filter
-            else:
-                raise ValueError(f"Not a valid filter: {filter}")
-
-            # Update the indices based on the invert
-            if invert:
-                indices.difference_update(nums)
-            else:
-                indices.update(nums)
-
-        # Remove name
-        name_idx = -1
-        if self.args.name:
-            match_nums = self._match_name(self.args.name)
-            if len(match_nums) == 0:
-                raise ValueError(f"Name: '{self.args.name}' not found. This is needed for the return address")
-            if len(match_nums) > 1:
-                raise ValueError(f"Name: '{self.args.name}' found multiple times. There can only be one for the return address")
-            indices.difference_update(match_nums)
-            name_idx = match_nums.pop()
+        with self.stats.stage("filter") as stage:
+            indices = CompiledFilter.compile(self.args.filter, self.max_row, self.table.sources).evaluate(self.name_index)
 
-        return indices, name_idx
+            # Remove name
+            name_idx = -1
+            if self.args.name:
+                name_idx = self.find_name_row(self.args.name)
+                indices = indices.difference(RowSet.from_range(name_idx, name_idx))
+            stage["rows"] = len(indices)
 
-    # Makes the method not take self as a parameter
-    @staticmethod
-    def _draw_address(label, width, height, address: Address | None):
-        """Draws an address to a label"""
-        if address is None:
-            return
+        self._report(STAGE_FILTER, len(indices), len(indices))
+        return indices, name_idx
 
+    def _deduplicate(self, indices: RowSet) -> RowSet:
+        """Removes the duplicate rows, and merges households if the dedup option is 'households'. Prints what was merged"""
+        from dedup import HOUSEHOLD, deduplicate
+
+        with self.stats.stage("dedup") as stage:
+            dedup = deduplicate(self.table, indices, households=self.args.dedup == "households")
+            self.merged_addresses = dedup.addresses
+            stage["rows"] = len(indices)
+
+        for merge in dedup.merges:
+            # Merged rows always have a last name, so the name is valid
+            _, name = self._format_address(self._get_address(merge.row))
+            print(f"Merged {merge.kind} row index '{self.table.row_id(merge.merged_row)}' into '{self.table.row_id(merge.row)}', name: '{name}'")
+        households = sum(merge.kind == HOUSEHOLD for merge in dedup.merges)
+        self.stats.count("merged_duplicates", len(dedup.merges) - households)
+        self.stats.count("merged_households", households)
+        print(f"Removed {len(dedup.merges) - households} duplicate(s) and merged {households} household(s)")
+        return dedup.indices
+
+    def _format_address(self, address: Address, warn: bool = True) -> tuple[tuple[str, ...], str] | None:
+        """
+        Returns the lines of the label from the bottom up and the name, or None if the name is invalid
+        Invalid names are warned about unless warn is False, like when a label checked at placement is drawn
+        """
         # Formats the name based on which entries are empty or not
         # John Miller, John & Mary Miller, John Miller & Mary Sue
         # If a single name, like a company, should only have last_name1
@@ -187,8 +228,10 @@ class LabelGenerator:
         elif address.last_name1:
             name = address.last_name1
         else:
-            print(f"Warning: Skipping line with invalid name '{address.last_name1} {address.first_name1} {address.last_name2} {address.first_name2}'")
-            return
+            if warn:
+                print(f"Warning: Skipping line with invalid name '{address.last_name1} {address.first_name1} {address.last_name2} {address.first_name2}'")
+                self.stats.count("skipped_invalid_names")
+            return None
 
         # Only include the PO box, if not empty
         street = address.address1
@@ -203,37 +246,79 @@ class LabelGenerator:
             street.upper(),
             name,
         ]
+        return tuple(line for line in lines if line), name
 
-        # From the pylables2 library docs
-        group = shapes.Group()
-        x, y = 0, 0
-        for line in lines:
-            if not line:
-                continue
-            shape = shapes.String(x, y, line, textAnchor="start", fontSize=10)
-            _, _, _, y = shape.getBounds()
-            y += 3
-            group.add(shape)
-        _, _, lx, ly = label.getBounds()
-        _, _, gx, gy = group.getBounds()
-
-        if gx > lx:
+    def _layout_text(self, lines: tuple[str, ...], width: float, height: float) -> TextLayout:
+        """Stacks the lines bottom up and centers them on the label, once per distinct label"""
+        key = (lines, self.args.shrink)
+        layout = self.layouts.get(key)
+        if layout is None:
+            from text_layout import layout_text
+
+            layout = self.layouts[key] = layout_text(lines, width, height, shrink=self.args.shrink)
+        return layout
+
+    def _check_label(self, address: Address | None, count: int, width: float, height: float):
+        """
+        Warns about a placed label once, counting every copy of it. The labels are drawn without warnings
+        Checked when placed, so the labels of cached pages that aren't drawn again are warned about too
+        """
+        if address is None:
+            return
+        formatted = self._format_address(address)
+        if formatted is None:
+            return
+        lines, name = formatted
+        layout = self._layout_text(lines, width, height)
+        if layout.width > width:
             print(f"Warning: Address too long, name: {name}")
-        if gy > ly:
+            self.stats.count("warned_too_long", count)
+        if layout.height > height:
             print(f"Warning: Address too tall, name: {name}")
+            self.stats.count("warned_too_tall", count)
+
+    def _address_layout(self, address: Address | None, width: float, height: float) -> TextLayout | None:
+        """Returns the layout of a label to draw, or None if there's nothing to draw"""
+        if address is None:
+            return None
+        formatted = self._format_address(address, warn=False)
+        if formatted is None:
+            return None
+        return self._layout_text(formatted[0], width, height)
+
+    def _template_cache(self) -> LabelTemplateCache:
+        """Returns the pylabels label templates, only created when needed since they import reportlab's graphics"""
+        if self.templates is None:
+            from label_templates import LabelTemplateCache
+
+            self.templates = LabelTemplateCache()
+        return self.templates
+
+    def _draw_address(self, label, width, height, address: Address | None):
+        """Draws an address to a pylabels label, reusing the shapes of identical labels"""
+        layout = self._address_layout(address, width, height)
+        if layout is None:
+            return
+        label.add(self._template_cache().get((layout.lines, self.args.shrink), layout.to_group))
 
-        dx = (lx - gx) / 2
-        dy = (ly - gy) / 2
-        group.translate(dx, dy)
+    def _draw_address_on_canvas(self, canvas, width, height, address: Address | None):
+        """Draws an address straight onto a canvas sheet label"""
+        layout = self._address_layout(address, width, height)
+        if layout is None:
+            return
+        if self.args.compact:
+            layout.draw_text_on(canvas)
+        else:
+            layout.draw_on(canvas)
 
-        label.add(group)
+    def _create_specification(self) -> Specification:
+        """Returns the label specification"""
+        from pylabels import Specification
 
-    def _create_sheet(self) -> Sheet:
-        """Creates a sheet that can be saved as a PDF"""
         # Follows the Avery 8160 specs
         # From the pylabels2 docs
         padding = 1
-        specs = Specification(
+        return Specification(
             215.9,
             279.4,
             3,
@@ -250,42 +335,328 @@ class LabelGenerator:
             bottom_padding=padding,
             row_gap=0,
         )
+
+    def _label_area(self, specs: Specification) -> tuple[float, float]:
+        """Returns the width and height in points a label's text is laid out in, inside the padding"""
+        from canvas_sheet import mm
+
+        width = float((specs.label_width - specs.left_padding - specs.right_padding) * mm)
+        height = float((specs.label_height - specs.top_padding - specs.bottom_padding) * mm)
+        return width, height
+
+    def _create_sheet(self) -> Sheet | CanvasSheet:
+        """Creates a sheet that can be saved as a PDF, with the chosen rendering engine"""
+        from pylabels import Sheet
+        from canvas_sheet import CanvasSheet
+
+        specs = self._create_specification()
+        if self.args.engine == "canvas":
+            return CanvasSheet(specs, self._draw_address_on_canvas, border=self.args.test, compact=self.args.compact)
         if self.args.test:
             return Sheet(specs, self._draw_address, border=True)
         return Sheet(specs, self._draw_address)
 
-    def _save_pdf(self, sheet: Sheet, indices: set[int], name_idx: int):
-        """Saves the sheet as a PDF"""
+    def _iter_labels(self, indices: RowSet, name_idx: int) -> Iterator[tuple[Address | None, int]]:
+        """Yields every label of the PDF in order as (address, count). Blank labels are None"""
         # Add blank labels
         if self.args.bias > 0:
-            sheet.add_label(None, count=self.args.bias)
+            yield None, self.args.bias
 
-        # Add labels for the indices
-        for i in sorted(list(indices)):
+        # Add labels for the indices, already in sorted order
+        for i in indices:
             address = self._get_address(i)
 
             if not any(address):
-                print(f"Warning: Skipping blank row index '{i}'")
+                print(f"Warning: Skipping blank row index '{self.table.row_id(i)}'")
+                self.stats.count("skipped_blank_rows")
                 continue
 
             if not address.last_name1 or not address.address1 or not address.city or not address.state or not address.zip:
-                print(f"Warning: Skipping row with name: '{address.first_name1}', index: '{i}' due to one or more missing address fields.")
+                print(f"Warning: Skipping row with name: '{address.first_name1}', index: '{self.table.row_id(i)}' due to one or more missing address fields.")
+                self.stats.count("skipped_missing_fields")
                 continue
 
-            sheet.add_label(address)
+            yield address, 1
 
         # Add return address labels
         if self.args.ret:
             if not self.args.name:
                 raise ValueError("Name must be set to use the ret option")
-            sheet.add_label(self._get_address(name_idx), count=len(indices))
-
-        sheet.save(self.args.output)
+            yield self._get_address(name_idx), len(indices)
+
+    def _place_labels(self, indices: RowSet, name_idx: int, specs: Specification) -> list[Address | None]:
+        """Returns every label of the PDF in order, with the copies repeated. Each label is checked once"""
+        width, height = self._label_area(specs)
+        labels = []
+        for address, count in self._iter_labels(indices, name_idx):
+            self._check_label(address, count, width, height)
+            labels.extend(repeat(address, count))
+        return labels
+
+    def _label_total(self, indices: RowSet) -> int:
+        """Returns the most labels the PDF can have, some rows may still be skipped"""
+        return self.args.bias + len(indices) * (2 if self.args.ret else 1)
+
+    def _save_sheet(self, sheet: Sheet | CanvasSheet, output: str | BinaryIO, on_page: Callable[[int], None] | None = None):
+        """Saves a sheet to a path or stream, written for size if compact"""
+        from canvas_sheet import CanvasSheet, binary_streams
+
+        if isinstance(sheet, CanvasSheet):
+            sheet.save(output, on_page=on_page)
+        elif self.args.compact:
+            # Pylabels draws its own labels, so only the streams can be made smaller
+            with binary_streams():
+                _save_pylabels_sheet(sheet, output, on_page)
+        else:
+            _save_pylabels_sheet(sheet, output, on_page)
+
+    def _write_merged(self, writer: PdfWriter, output: str | BinaryIO):
+        """Writes joined PDFs. If compact, the fonts and forms each part repeats are only written once"""
+        if self.args.compact:
+            for _ in range(MERGE_PASSES):
+                writer.compress_identical_objects()
+        writer.write(output)
+
+    def _report_size(self, page_count: int):
+        """Prints the size of the written PDF per page, in compact mode"""
+        size = self.stats.extra.get("pdf_bytes")
+        if self.args.compact and size is not None:
+            print(f"{size:,} bytes written, {size // max(1, page_count):,} bytes/page.")
+
+    @contextmanager
+    def _output(self, stream: BinaryIO | None = None) -> Iterator[str | BinaryIO]:
+        """
+        Yields where to write the PDF: the stream if it's given, else a temporary path next to the output
+        The temporary path replaces the output once written, or is removed on errors, so there's never a partial output
+        The size written is kept in the stats, unless the stream can't tell its position
+        """
+        if stream is not None:
+            start = stream.tell() if stream.seekable() else None
+            yield stream
+            if start is not None:
+                self.stats.extra["pdf_bytes"] = stream.tell() - start
+            return
+        output = Path(self.args.output)
+        tmp = output.with_name(f".{output.name}.{os.getpid()}.tmp")
+        try:
+            yield str(tmp)
+            self.stats.extra["pdf_bytes"] = tmp.stat().st_size
+            os.replace(tmp, output)
+        except BaseException:
+            tmp.unlink(missing_ok=True)
+            raise
+
+    def _save_pdf(self, sheet: Sheet | CanvasSheet, indices: RowSet, name_idx: int, stream: BinaryIO | None = None) -> tuple[int, int]:
+        """Saves the sheet as a PDF, to the stream if it's given. Returns the label and page count"""
+        total = self._label_total(indices)
+        width, height = self._label_area(sheet.specs)
+        # Pylabels draws each label as it's added, the canvas engine when it's saved
+        with self.stats.stage("place") as stage:
+            for address, count in self._iter_labels(indices, name_idx):
+                placed = sheet.label_count
+                self._check_label(address, count, width, height)
+                sheet.add_label(address, count=count)
+                if sheet.label_count // PROGRESS_LABELS != placed // PROGRESS_LABELS:
+                    self._report(STAGE_PLACE, sheet.label_count, total)
+            stage["labels"] = sheet.label_count
+        self._report(STAGE_PLACE, sheet.label_count, sheet.label_count)
+
+        with self.stats.stage("save") as stage, self._output(stream) as output:
+            self._save_sheet(sheet, output, on_page=lambda pages: self._report(STAGE_WRITE, pages, sheet.page_count))
+            stage["labels"] = sheet.label_count
+            stage["pages"] = sheet.page_count
+            self._report(STAGE_WRITE, sheet.page_count, sheet.page_count)
         print(f"{sheet.label_count} label(s) output on {sheet.page_count} page(s).")
+        self._report_size(sheet.page_count)
+        return sheet.label_count, sheet.page_count
 
-    def generate_pdf(self):
+    def _save_pdf_parallel(self, indices: RowSet, name_idx: int, stream: BinaryIO | None = None) -> tuple[int, int]:
+        """
+        Saves the PDF by rendering page aligned chunks of the labels in a process pool
+        The partial PDFs are then joined in order into the output. Returns the label and page count
+        """
+        import tempfile
+        from concurrent.futures import ProcessPoolExecutor
+        from pypdf import PdfWriter
+
+        specs = self._create_specification()
+        with self.stats.stage("place") as stage:
+            labels = self._place_labels(indices, name_idx, specs)
+            stage["labels"] = len(labels)
+        self._report(STAGE_PLACE, len(labels), len(labels))
+        labels_per_page = specs.rows * specs.columns
+        page_count = -(-len(labels) // labels_per_page)
+
+        # A few chunks per job so a slow chunk doesn't hold up the rest
+        pages_per_chunk = max(1, -(-page_count // (self.args.jobs * CHUNKS_PER_JOB)))
+        chunk_size = pages_per_chunk * labels_per_page
+        # Still render one empty chunk, so the output is the same blank PDF as a serial run
+        chunks = [labels[i:i + chunk_size] for i in range(0, len(labels), chunk_size)] or [[]]
+
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = [str(Path(tmp) / f"{i}.pdf") for i in range(len(chunks))]
+            with self.stats.stage("render") as stage, ProcessPoolExecutor(max_workers=self.args.jobs) as executor:
+                try:
+                    for i, _ in enumerate(executor.map(_render_chunk, repeat(self.args), chunks, paths), 1):
+                        self._report(STAGE_WRITE, min(i * pages_per_chunk, page_count), page_count)
+                except GenerationCancelled:
+                    # Don't wait for the chunks that haven't started
+                    executor.shutdown(cancel_futures=True)
+                    raise
+                stage["labels"] = len(labels)
+                stage["pages"] = page_count
+
+            with self.stats.stage("merge") as stage:
+                writer = PdfWriter()
+                for path in paths:
+                    writer.append(path)
+                with self._output(stream) as output:
+                    self._write_merged(writer, output)
+                stage["pages"] = page_count
+
+        print(f"{len(labels)} label(s) output on {page_count} page(s).")
+        self._report_size(page_count)
+        return len(labels), page_count
+
+    def _page_options(self, specs: Specification) -> str:
+        """Returns everything besides the labels that changes how a page is drawn, for the page cache keys"""
+        import text_layout
+
+        spec = sorted((k, str(v)) for k, v in vars(specs).items() if k != "_autoset")
+        font = (text_layout.FONT_NAME, text_layout.FONT_SIZE, text_layout.MIN_FONT_SIZE, text_layout.FONT_SIZE_STEP, text_layout.LINE_GAP)
+        return repr((self.args.engine, self.args.test, self.args.shrink, self.args.compact, spec, font))
+
+    def _save_pdf_cached(self, indices: RowSet, name_idx: int, stream: BinaryIO | None = None) -> tuple[int, int]:
+        """
+        Saves the PDF from cached pages, only rendering the pages whose labels or options changed
+        The new pages are rendered together, then split into the cache. Returns the label and page count
+        """
+        import io
+        from pypdf import PdfReader, PdfWriter
+        from page_cache import PageCache
+
+        specs = self._create_specification()
+        with self.stats.stage("place") as stage:
+            labels = self._place_labels(indices, name_idx, specs)
+            stage["labels"] = len(labels)
+        self._report(STAGE_PLACE, len(labels), len(labels))
+        if not labels:
+            # Nothing to cache, so the same empty PDF as a serial run
+            with self._output(stream) as output:
+                self._save_sheet(self._create_sheet(), output)
+            print("0 label(s) output on 0 page(s).")
+            return 0, 0
+
+        labels_per_page = specs.rows * specs.columns
+        pages = [labels[i:i + labels_per_page] for i in range(0, len(labels), labels_per_page)]
+
+        cache = PageCache()
+        options = self._page_options(specs)
+        keys = [cache.key(page, options) for page in pages]
+        paths = [cache.load(key) for key in keys]
+        missing = [i for i, path in enumerate(paths) if path is None]
+        self.stats.count("cached_pages", len(pages) - len(missing))
+
+        with self.stats.stage("render") as stage:
+            if missing:
+                # Only the last page can be partly filled, so the missing pages stay page aligned
+                sheet = self._create_sheet()
+                for i in missing:
+                    for address in pages[i]:
+                        sheet.add_label(address)
+                rendered = io.BytesIO()
+                self._save_sheet(sheet, rendered)
+
+                reader = PdfReader(rendered)
+                for done, (i, page) in enumerate(zip(missing, reader.pages), 1):
+                    writer = PdfWriter()
+                    writer.add_page(page)
+                    data = io.BytesIO()
+                    writer.write(data)
+                    paths[i] = cache.store(keys[i], data.getvalue())
+                    self._report(STAGE_WRITE, done, len(missing))
+            stage["pages"] = len(missing)
+
+        with self.stats.stage("merge") as stage:
+            writer = PdfWriter()
+            for path in paths:
+                writer.append(path)
+            with self._output(stream) as output:
+                self._write_merged(writer, output)
+            stage["pages"] = len(pages)
+        cache.evict()
+
+        print(f"{len(labels)} label(s) output on {len(pages)} page(s), {len(missing)} rendered.")
+        self._report_size(len(pages))
+        return len(labels), len(pages)
+
+    def pdf_bytes(self) -> bytes:
+        """Filters the rows and returns the PDF, without writing the output"""
+        import io
+
+        stream = io.BytesIO()
+        self.generate_pdf(stream)
+        return stream.getvalue()
+
+    def generate_pdf(self, stream: BinaryIO | None = None) -> tuple[int, int]:
+        """
+        Filters the rows and saves the PDF. Returns the label and page count
+        If a binary stream is given the PDF is written to it instead of the output, and it's never launched
+        """
         indices, name_idx = self._filter_indices()
-        sheet = self._create_sheet()
-        self._save_pdf(sheet, indices, name_idx)
-        if self.args.launch:
+        if self.args.dedup != "off":
+            indices = self._deduplicate(indices)
+        if self.args.page_cache:
+            if self.args.jobs > 1:
+                print("Warning: The page cache renders the missing pages in one process, ignoring --jobs")
+            counts = self._save_pdf_cached(indices, name_idx, stream)
+        elif self.args.jobs > 1:
+            counts = self._save_pdf_parallel(indices, name_idx, stream)
+        else:
+            sheet = self._create_sheet()
+            counts = self._save_pdf(sheet, indices, name_idx, stream)
+        if self.args.launch and stream is None:
+            import webbrowser
+
             webbrowser.open(self.args.output)
+        return counts
+
+
+def _address_values(record: Sequence | dict) -> tuple:
+    """Returns the field values of an address record, with empty strings as None like the file readers"""
+    if isinstance(record, dict):
+        unknown = set(record) - set(Address._fields)
+        if unknown:
+            raise ValueError(f"Unknown address fields: {', '.join(sorted(unknown))}. Fields are: {', '.join(Address._fields)}")
+        record = [record.get(field) for field in Address._fields]
+    elif len(record) > ADDRESS_COLUMN_COUNT:
+        raise ValueError(f"Address has {len(record)} values, there are only {ADDRESS_COLUMN_COUNT} fields")
+    return tuple(value if value != "" else None for value in record)
+
+
+def _save_pylabels_sheet(sheet: Sheet, output: str | BinaryIO, on_page: Callable[[int], None] | None = None):
+    """
+    Saves a pylabels sheet the same way as Sheet.save, but calls on_page with the count of pages written after each one
+    Rendering the pages is most of a pylabels run, so this is where progress is reported and a cancel is noticed
+    """
+    from reportlab.graphics import renderPDF
+    from reportlab.pdfgen.canvas import Canvas
+
+    sheet._shade_remaining_missing()
+    canvas = Canvas(output, pagesize=sheet._pagesize)
+    canvas.setViewerPreference("PrintScaling", "None")
+    for i, page in enumerate(sheet._pages, 1):
+        renderPDF.draw(page, canvas, 0, 0)
+        canvas.showPage()
+        if on_page is not None:
+            on_page(i)
+    canvas.save()
+
+
+def _render_chunk(args: Namespace, labels: list[Address | None], path: str):
+    """Renders a chunk of labels to a partial PDF, in a worker process. The labels were already checked when placed"""
+    label_generator = LabelGenerator(args, AddressTable.empty())
+    sheet = label_generator._create_sheet()
+    for address in labels:
+        sheet.add_label(address)
+    label_generator._save_sheet(sheet, path)
@@ -1,10 +1,15 @@
 
 import customtkinter as ctk
+import queue
+import threading
 from argparse import Namespace
 from pathlib import Path
 from typing import Callable
-from main import get_args
-from label_generator import LabelGenerator
+from main import get_args, DEDUP_MODES, ENGINES
+from label_generator import LabelGenerator, GenerationCancelled, STAGE_READ, STAGE_FILTER, STAGE_PLACE, STAGE_WRITE
+from filter_engine import IncrementalFilter, RowSet
+from readers import input_paths
+from watch import fingerprint, send_job
 
 # NOTE: this is my using this library or any python gui lol
 
@@ -17,6 +22,18 @@ BUTTON_WIDTH = 75
 
 UI_SCALE = 1
 
+# How often the worker events are checked, in milliseconds
+POLL_MS = 50
+# How long to wait after the last edit before updating the filter preview, in milliseconds
+PREVIEW_DEBOUNCE_MS = 150
+
+STAGE_TEXT = {
+    STAGE_READ: "Reading rows",
+    STAGE_FILTER: "Matched rows",
+    STAGE_PLACE: "Placing labels",
+    STAGE_WRITE: "Writing pages",
+}
+
 
 class LabelGeneratorApp:
     def __init__(self, inital_args: Namespace, save_options_func: Callable[[Namespace], None]):
@@ -24,14 +41,36 @@ class LabelGeneratorApp:
 
         # Backing values for gui options
         self.input_var = ctk.StringVar()
+        self.header_var = ctk.BooleanVar()
+        self.columns_var = ctk.StringVar()
         self.output_var = ctk.StringVar()
         self.filter_var = ctk.StringVar()
         self.bias_var = ctk.StringVar()
         self.ret_var = ctk.BooleanVar()
         self.name_var = ctk.StringVar()
+        self.shrink_var = ctk.BooleanVar()
         self.test_var = ctk.BooleanVar()
+        self.compact_var = ctk.BooleanVar()
+        self.engine_var = ctk.StringVar()
+        self.dedup_var = ctk.StringVar()
         self.launch_var = ctk.BooleanVar()
         self.tooltip_var = ctk.StringVar(value="")
+        self.status_var = ctk.StringVar(value="")
+
+        # The PDF is generated on a worker thread, which sends its events to the gui through the queue
+        self.worker: threading.Thread | None = None
+        self.worker_events: queue.Queue = queue.Queue()
+        self.cancel_event = threading.Event()
+
+        # The input is kept loaded for the live filter preview, and reloaded when the input options change
+        self.preview_var = ctk.StringVar(value="")
+        self.preview_key: tuple | None = None
+        self.preview_generator: LabelGenerator | None = None
+        # The input files' mtimes and sizes when the preview loaded them
+        self.preview_fingerprint: tuple | None = None
+        self.preview_filter: IncrementalFilter | None = None
+        self.preview_load_after: str | None = None
+        self.preview_after: str | None = None
 
         self._set_options(inital_args)
         self.save_options_func = save_options_func
@@ -40,16 +79,29 @@ class LabelGeneratorApp:
 
         # Setup the UI
         self._setup_input_option()
+        self._setup_header_option()
+        self._setup_columns_option()
         self._setup_output_option()
         self._setup_filter_option()
         self._setup_bias_option()
         self._setup_ret_option()
         self._setup_name_option()
+        self._setup_shrink_option()
         self._setup_test_option()
+        self._setup_compact_option()
+        self._setup_engine_option()
+        self._setup_dedup_option()
         self._setup_launch_option()
         self._setup_tasks_bar()
         self._setup_tooltip_bar()
 
+        # Only watch the options once they're set, then do the first load
+        for var in (self.input_var, self.header_var, self.columns_var):
+            var.trace_add("write", self._schedule_preview_load)
+        for var in (self.filter_var, self.name_var):
+            var.trace_add("write", self._schedule_preview)
+        self._schedule_preview_load()
+
     def _create_root(self) -> ctk.CTk:
         """Creates CTK root and sets vars"""
         ctk.set_appearance_mode("dark")
@@ -62,52 +114,225 @@ class LabelGeneratorApp:
     def _set_options(self, args: Namespace):
         """Sets the option variable from an args"""
         self.input_var.set(args.input)
+        self.header_var.set(args.header)
+        self.columns_var.set(args.columns)
         self.output_var.set(args.output)
         self.filter_var.set(args.filter)
         self.bias_var.set(args.bias)
         self.ret_var.set(args.ret)
         self.name_var.set(args.name)
+        self.shrink_var.set(args.shrink)
         self.test_var.set(args.test)
+        self.compact_var.set(args.compact)
+        self.engine_var.set(args.engine)
+        self.dedup_var.set(args.dedup)
         self.launch_var.set(args.launch)
 
     def _get_args_from_options(self) -> Namespace:
         """Returns args from the options"""
-        return Namespace(
+        options = Namespace(
             input=self.input_var.get(),
+            header=self.header_var.get(),
+            columns=self.columns_var.get(),
             output=self.output_var.get(),
             filter=self.filter_var.get(),
             bias=int(self.bias_var.get()) if self.bias_var.get() else 0,
             ret=self.ret_var.get(),
             name=self.name_var.get(),
+            shrink=self.shrink_var.get(),
             test=self.test_var.get(),
+            compact=self.compact_var.get(),
+            engine=self.engine_var.get(),
+            dedup=self.dedup_var.get(),
             launch=self.launch_var.get(),
         )
+        # Options without a widget keep their default
+        return Namespace(**{**vars(get_args(True)), **vars(options)})
 
     def _generate_pdf(self):
-        """Actually generates the PDF and saves the options config"""
+        """Starts generating the PDF on a worker thread and saves the options config"""
+        if self.worker is not None and self.worker.is_alive():
+            return
         args = self._get_args_from_options()
+        self.save_options_func(args)
+
+        self.cancel_event.clear()
+        self.run_button.configure(state="disabled")
+        self.cancel_button.configure(state="normal")
+        self.progress_bar.set(0)
+        self.status_var.set("Starting...")
+
+        self.worker = threading.Thread(target=self._run_worker, args=(args, self._loaded_generator(args)), daemon=True)
+        self.worker.start()
+        self.root.after(POLL_MS, self._poll_worker)
+
+    def _loaded_generator(self, args: Namespace) -> LabelGenerator | None:
+        """Returns the preview's loaded input if it's the one the args read and its files haven't changed since"""
+        if self.preview_generator is None or self.preview_key != (args.input, args.header, args.columns):
+            return None
+        if self.preview_fingerprint is None or fingerprint(input_paths(args.input)) != self.preview_fingerprint:
+            return None
+        return self.preview_generator
+
+    def _run_worker(self, args: Namespace, loaded: LabelGenerator | None = None):
+        """
+        Generates the PDF on the worker thread. Never touches the widgets, only sends events
+        If a warm process was started with --watch the job is sent to it, since it already has the input loaded
+        Otherwise the input the preview loaded is used, and only loaded again if the preview doesn't have it
+        """
+        def progress(stage: str, done: int, total: int):
+            self.worker_events.put(("progress", stage, done, total))
+
         try:
-            label_generator = LabelGenerator(args)
-            label_generator.generate_pdf()
+            try:
+                label_count, page_count = send_job(args, args.port, progress, self.cancel_event)
+            except ConnectionRefusedError:
+                if loaded is not None:
+                    label_generator = loaded.with_args(args, progress, self.cancel_event)
+                else:
+                    label_generator = LabelGenerator(args, progress=progress, cancel=self.cancel_event)
+                label_count, page_count = label_generator.generate_pdf()
+            self.worker_events.put(("done", f"{label_count} label(s) output on {page_count} page(s)."))
+        except GenerationCancelled:
+            self.worker_events.put(("done", "Cancelled"))
         except Exception as e:
-            self.tooltip_var.set(e)
             print(e)
-        self.save_options_func(args)
+            self.worker_events.put(("error", str(e)))
+
+    def _poll_worker(self):
+        """Shows the worker events, until it's finished"""
+        finished = False
+        try:
+            while True:
+                event = self.worker_events.get_nowait()
+                if event[0] == "progress":
+                    self._show_progress(*event[1:])
+                    continue
+                finished = True
+                self.status_var.set(event[1])
+                if event[0] == "error":
+                    self.progress_bar.set(0)
+                    self.tooltip_var.set(event[1])
+                elif not self.cancel_event.is_set():
+                    self.progress_bar.set(1)
+        except queue.Empty:
+            pass
+
+        if finished:
+            self.run_button.configure(state="normal")
+            self.cancel_button.configure(state="disabled")
+        else:
+            self.root.after(POLL_MS, self._poll_worker)
+
+    def _show_progress(self, stage: str, done: int, total: int):
+        """Shows a progress event in the status text and progress bar"""
+        text = STAGE_TEXT.get(stage, stage)
+        if total:
+            self.status_var.set(f"{text}: {done}/{total}")
+            # Placing is the first half of the bar and writing the rest. Reading has no total, so it only shows its row count
+            if stage == STAGE_PLACE:
+                self.progress_bar.set(0.5 * done / total)
+            elif stage == STAGE_WRITE:
+                self.progress_bar.set(0.5 + 0.5 * done / total)
+        else:
+            self.status_var.set(f"{text}: {done}")
+
+    def _cancel_pdf(self):
+        """Stops the worker at its next progress report, no output is written"""
+        if self.worker is not None and self.worker.is_alive():
+            self.cancel_event.set()
+            self.cancel_button.configure(state="disabled")
+            self.status_var.set("Cancelling...")
+
+    def _schedule_preview_load(self, *_):
+        """Reloads the preview data once the input options stop changing"""
+        if self.preview_load_after is not None:
+            self.root.after_cancel(self.preview_load_after)
+        self.preview_load_after = self.root.after(PREVIEW_DEBOUNCE_MS, self._load_preview)
+
+    def _load_preview(self):
+        """Loads the input for the preview on a thread, the workbook cache makes reloads fast"""
+        self.preview_load_after = None
+        args = self._get_args_from_options()
+        self.preview_key = (args.input, args.header, args.columns)
+        self.preview_generator = None
+        self.preview_fingerprint = None
+        self.preview_filter = None
+        self.preview_var.set("Loading input...")
+        # Each load gets its own queue, so a slow old load can't be mistaken for the newest
+        events = queue.Queue()
+        threading.Thread(target=self._run_preview_loader, args=(args, self.preview_key, events), daemon=True).start()
+        self.root.after(POLL_MS, self._poll_preview_loader, events)
+
+    def _run_preview_loader(self, args: Namespace, key: tuple, events: queue.Queue):
+        """Loads the input on the loader thread. Never touches the widgets, only sends events"""
+        try:
+            # Taken before loading, so a file saved during the load isn't mistaken for the loaded one
+            files = fingerprint(input_paths(args.input))
+            events.put((key, LabelGenerator(args), files, None))
+        except Exception as e:
+            events.put((key, None, None, str(e)))
+
+    def _poll_preview_loader(self, events: queue.Queue):
+        """Keeps the newest loaded input, ignoring loads of input options that already changed"""
+        try:
+            key, label_generator, files, error = events.get_nowait()
+        except queue.Empty:
+            self.root.after(POLL_MS, self._poll_preview_loader, events)
+            return
+        if key != self.preview_key:
+            return
+        if error is not None:
+            self.preview_var.set(error)
+            return
+        self.preview_generator = label_generator
+        self.preview_fingerprint = files
+        self.preview_filter = IncrementalFilter(label_generator.name_index, label_generator.max_row, label_generator.table.sources)
+        self._update_preview()
+
+    def _schedule_preview(self, *_):
+        """Updates the preview once the filter and name stop changing"""
+        if self.preview_after is not None:
+            self.root.after_cancel(self.preview_after)
+        self.preview_after = self.root.after(PREVIEW_DEBOUNCE_MS, self._update_preview)
+
+    def _update_preview(self):
+        """Shows the rows the filter selects, the return address row and any invalid filters"""
+        self.preview_after = None
+        if self.preview_filter is None:
+            return
+        preview = self.preview_filter.evaluate(self.filter_var.get())
+        rows = preview.rows
+
+        lines = []
+        name = self.name_var.get()
+        if name:
+            try:
+                name_row = self.preview_generator.find_name_row(name)
+                rows = rows.difference(RowSet.from_range(name_row, name_row))
+                lines.append(f"Return address: row {self.preview_generator.table.row_id(name_row)}")
+            except ValueError as e:
+                lines.append(str(e))
+        lines.insert(0, f"Selected {len(rows)} row(s)")
+        if preview.terms:
+            lines.append(", ".join(f"{f}: {count}" for f, count in preview.terms))
+        lines.extend(preview.errors)
+        self.preview_var.set("\n".join(lines))
 
     def _update_input_var(self):
-        """Gets input path from the user"""
-        dir_path = Path(self.input_var.get()).parent
+        """Gets the input paths from the user, several files are read as one input"""
+        paths = input_paths(self.input_var.get()) if self.input_var.get() else []
+        dir_path = paths[0].parent if paths else Path(".")
         if dir_path == Path("."):
             dir_path = Path.home()
-        path = ctk.filedialog.askopenfilename(
-            title="Select a File",
-            # filetypes=[("Data files", "*.csv *.xlsx"), ("All files", "*.*")],
-            filetypes=[("Data files", "*.xlsx"), ("All files", "*.*")],
+        selected = ctk.filedialog.askopenfilenames(
+            title="Select Files",
+            filetypes=[("Data files", "*.xlsx *.csv *.tsv"), ("All files", "*.*")],
             initialdir=str(dir_path)
         )
-        if not path:
+        if not selected:
             return
-        self.input_var.set(path)
+        self.input_var.set(", ".join(selected))
 
     def _update_output_var(self):
         """Gets the output path from the user"""
@@ -152,7 +377,7 @@ class LabelGeneratorApp:
         base.grid(row=1, column=1, padx=INNER_PADX, pady=INNER_PADY, sticky="e")
 
     def _setup_input_option(self):
-        input_frame = self._create_frame("<Input> An Excel file that holds the address data")
+        input_frame = self._create_frame("<Input> Excel, CSV or TSV files that hold the address data. Their rows are picked in the filter by file or sheet name, like 'west:4-9'")
         input_header = ctk.CTkLabel(input_frame, text="Input")
         self._set_grid_top(input_header)
         input_widget = ctk.CTkLabel(input_frame, textvariable=self.input_var)
@@ -160,6 +385,24 @@ class LabelGeneratorApp:
         input_button = ctk.CTkButton(input_frame, text="Choose...", command=self._update_input_var, width=BUTTON_WIDTH)
         self._set_grid_right(input_button)
 
+    def _setup_header_option(self):
+        header_frame = self._create_frame("<Header> The first row of the input is a header and is skipped")
+        header_widget = ctk.CTkCheckBox(header_frame, text="Header", variable=self.header_var)
+        self._set_grid_bottom(header_widget)
+
+    def _setup_columns_option(self):
+        columns_frame = self._create_frame(
+            """
+<Columns> Maps address fields to input columns, by header name or 1 based number, seperated by commas
+Fields not listed keep their default column. Leave a column empty to always leave the field empty
+Ex: 'last_name1=Surname, first_name1=Given, zip=9, country='
+"""
+        )
+        columns_header = ctk.CTkLabel(columns_frame, text="Columns")
+        self._set_grid_top(columns_header)
+        columns_widget = ctk.CTkEntry(columns_frame, textvariable=self.columns_var)
+        self._set_grid_bottom(columns_widget)
+
     def _setup_output_option(self):
         output_frame = self._create_frame("<Output> The path of the pdf that will be created")
         output_header = ctk.CTkLabel(output_frame, text="Output")
@@ -177,6 +420,8 @@ class LabelGeneratorApp:
 3 -> single row index
 4-9 -> range of row indices
 mary jane -> match rows by name. all words in the filter must be included in the row to match
+jo* -> match names starting with jo
+~smyth -> match names within a typo or two, like smith
 ! -> removes the filter instead of add
 Ex: '*, !5-20, !john, 15' -> adds all rows, removes range 5-10, removes all john rows, then adds row 15
 """
@@ -185,6 +430,8 @@ Ex: '*, !5-20, !john, 15' -> adds all rows, removes range 5-10, removes all john
         self._set_grid_top(filter_header)
         filter_widget = ctk.CTkEntry(filter_frame, textvariable=self.filter_var)
         self._set_grid_bottom(filter_widget)
+        preview_widget = ctk.CTkLabel(filter_frame, textvariable=self.preview_var, justify="left")
+        preview_widget.grid(row=2, column=0, columnspan=2, padx=INNER_PADX, pady=INNER_PADY, sticky="w")
 
     def _setup_bias_option(self):
         bias_frame = self._create_frame("<Bias> Number of labels to skip before printing. This is for partially used label sheets")
@@ -205,11 +452,35 @@ Ex: '*, !5-20, !john, 15' -> adds all rows, removes range 5-10, removes all john
         name_widget = ctk.CTkEntry(name_frame, textvariable=self.name_var)
         self._set_grid_bottom(name_widget)
 
+    def _setup_shrink_option(self):
+        shrink_frame = self._create_frame("<Shrink> Shrinks the font of labels that are too long or too tall to fit")
+        shrink_widget = ctk.CTkCheckBox(shrink_frame, text="Shrink", variable=self.shrink_var)
+        self._set_grid_bottom(shrink_widget)
+
     def _setup_test_option(self):
         test_frame = self._create_frame("<Test> Adds a box line around the labels")
         test_widget = ctk.CTkCheckBox(test_frame, text="Test", variable=self.test_var)
         self._set_grid_bottom(test_widget)
 
+    def _setup_compact_option(self):
+        compact_frame = self._create_frame("<Compact> Writes a smaller pdf that's faster to send to a printer. Smallest with the canvas engine")
+        compact_widget = ctk.CTkCheckBox(compact_frame, text="Compact", variable=self.compact_var)
+        self._set_grid_bottom(compact_widget)
+
+    def _setup_engine_option(self):
+        engine_frame = self._create_frame("<Engine> The rendering engine. Canvas draws straight to the pdf and is much faster")
+        engine_header = ctk.CTkLabel(engine_frame, text="Engine")
+        self._set_grid_top(engine_header)
+        engine_widget = ctk.CTkOptionMenu(engine_frame, values=list(ENGINES), variable=self.engine_var)
+        self._set_grid_bottom(engine_widget)
+
+    def _setup_dedup_option(self):
+        dedup_frame = self._create_frame("<Dedup> Removes duplicate addresses. Households also merges two people at the same address into one label")
+        dedup_header = ctk.CTkLabel(dedup_frame, text="Dedup")
+        self._set_grid_top(dedup_header)
+        dedup_widget = ctk.CTkOptionMenu(dedup_frame, values=list(DEDUP_MODES), variable=self.dedup_var)
+        self._set_grid_bottom(dedup_widget)
+
     def _setup_launch_option(self):
         launch_frame = self._create_frame("<Launch> Opens the output pdf in the browser when its created")
         launch_widget = ctk.CTkCheckBox(launch_frame, text="Launch", variable=self.launch_var)
@@ -218,15 +489,26 @@ Ex: '*, !5-20, !john, 15' -> adds all rows, removes range 5-10, removes all john
     def _setup_tasks_bar(self):
         task_frame = ctk.CTkFrame(self.root)
         task_frame.grid(row=self.frame_row, column=0, padx=OUTER_PADX, pady=OUTER_PADY, sticky="w")
-        task_frame.grid_columnconfigure(0, weight=1, minsize=MIN_FRAME_SIZE / 2)
-        task_frame.grid_columnconfigure(1, weight=1, minsize=MIN_FRAME_SIZE / 2)
+        task_frame.grid_columnconfigure(0, weight=1, minsize=MIN_FRAME_SIZE / 3)
+        task_frame.grid_columnconfigure(1, weight=1, minsize=MIN_FRAME_SIZE / 3)
+        task_frame.grid_columnconfigure(2, weight=1, minsize=MIN_FRAME_SIZE / 3)
         self.frame_row += 1
 
-        run_button = ctk.CTkButton(task_frame, text="Run", command=self._generate_pdf, width=BUTTON_WIDTH)
-        run_button.grid(row=1, column=0, padx=INNER_PADX, pady=INNER_PADY)
+        self.run_button = ctk.CTkButton(task_frame, text="Run", command=self._generate_pdf, width=BUTTON_WIDTH)
+        self.run_button.grid(row=1, column=0, padx=INNER_PADX, pady=INNER_PADY)
+
+        self.cancel_button = ctk.CTkButton(task_frame, text="Cancel", command=self._cancel_pdf, width=BUTTON_WIDTH, state="disabled")
+        self.cancel_button.grid(row=1, column=1, padx=INNER_PADX, pady=INNER_PADY)
 
         reset_button = ctk.CTkButton(task_frame, text="Reset Options", command=lambda: self._set_options(get_args(True)), width=BUTTON_WIDTH)
-        reset_button.grid(row=1, column=1, padx=INNER_PADX, pady=INNER_PADY)
+        reset_button.grid(row=1, column=2, padx=INNER_PADX, pady=INNER_PADY)
+
+        self.progress_bar = ctk.CTkProgressBar(task_frame)
+        self.progress_bar.set(0)
+        self.progress_bar.grid(row=2, column=0, columnspan=3, padx=INNER_PADX, pady=INNER_PADY, sticky="ew")
+
+        status_widget = ctk.CTkLabel(task_frame, textvariable=self.status_var)
+        status_widget.grid(row=3, column=0, columnspan=3, padx=INNER_PADX, pady=INNER_PADY, sticky="w")
 
     def _setup_tooltip_bar(self):
         tooltip_frame = self._create_frame(None)
@@ -236,4 +518,8 @@ Ex: '*, !5-20, !john, 15' -> adds all rows, removes range 5-10, removes all john
     def mainloop(self):
         """Runs the app and saves options config on end"""
         self.root.mainloop()
+        # Stop a running worker, so it doesn't leave a partial PDF
+        self.cancel_event.set()
+        if self.worker is not None:
+            self.worker.join()
         self.save_options_func(self._get_args_from_options())
@@ -0,0 +1,58 @@
+from typing import Callable
+from weakref import WeakKeyDictionary
+from reportlab.graphics import shapes
+from reportlab.lib.attrmap import AttrMap, AttrMapValue
+from reportlab.lib.validators import isString
+
+# Page streams are compressed, so a form only pays for itself once a label repeats this much
+FORM_MIN_PLACEMENTS = 10
+
+
+class LabelTemplate(shapes.DirectDraw):
+    """
+    A laid out label that is written to the PDF once as a form object
+    Once the label repeats, every placement just references that form
+    """
+
+    _attrMap = AttrMap(
+        name=AttrMapValue(isString, desc="Name of the PDF form"),
+        group=AttrMapValue(None, desc="The laid out shapes of the label"),
+    )
+
+    def __init__(self, name: str, group: shapes.Group):
+        self.name = name
+        self.group = group
+        # Placements drawn on each canvas so far
+        self._draws = WeakKeyDictionary()
+
+    def getBounds(self):
+        return self.group.getBounds()
+
+    def drawDirectly(self, renderer):
+        """Draws the label inline until it repeats enough, then defines the form and stamps it"""
+        canvas = renderer._canvas
+        if not canvas.hasForm(self.name):
+            draws = self._draws.get(canvas, 0) + 1
+            self._draws[canvas] = draws
+            if draws < FORM_MIN_PLACEMENTS:
+                renderer.drawNode(self.group)
+                return
+            canvas.beginForm(self.name)
+            renderer.drawNode(self.group)
+            canvas.endForm()
+        canvas.doForm(self.name)
+
+
+class LabelTemplateCache:
+    """Label templates keyed by the formatted label content, so each distinct label is only laid out once"""
+
+    def __init__(self):
+        self.templates: dict[tuple, LabelTemplate] = {}
+
+    def get(self, key: tuple, layout: Callable[[], shapes.Group]) -> LabelTemplate:
+        """Returns the template for the key, calling layout only if it's not cached yet"""
+        template = self.templates.get(key)
+        if template is None:
+            template = LabelTemplate(f"Label{len(self.templates)}", layout())
+            self.templates[key] = template
+        return template
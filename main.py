@@ -1,8 +1,13 @@
 #!/usr/bin/env -S uv run --script
 
 import argparse
+import sys
 from argparse import Namespace
-from label_generator import LabelGenerator
+from contextlib import nullcontext
+from pathlib import Path
+
+ENGINES = ("pylabels", "canvas")
+DEDUP_MODES = ("off", "exact", "households")
 
 
 def get_args(defaults: bool = False) -> Namespace:
@@ -11,13 +16,29 @@ def get_args(defaults: bool = False) -> Namespace:
         prog="address_label",
         description="Creates a pdf for printing address labels from an Excel file.",
     )
-    parser.add_argument("-i", "--input", default="addresses.xlsx")
+    parser.add_argument("-i", "--input", default="addresses.xlsx", help="An .xlsx, .csv or .tsv file, or several separated by commas. Pick sheets like 'regions.xlsx:west' or 'regions.xlsx:*'")
+    parser.add_argument("--no-header", dest="header", action="store_false", help="The first row is an address, not a header")
+    parser.add_argument("-c", "--columns", default="", help="Map fields to columns by header name or number. Ex: 'last_name1=Surname, zip=9'")
     parser.add_argument("-o", "--output", default="labels.pdf")
-    parser.add_argument("-f", "--filter", default="*", help="Ex: 'mary joe, 4-9, !5'")
+    parser.add_argument("-f", "--filter", default="*", help="Ex: 'mary joe, 4-9, !5, west:2-20'. Names can be prefixes like 'jo*' or fuzzy like '~smyth'")
     parser.add_argument("-b", "--bias", type=int, default=0, help="Count of labels to offset")
     parser.add_argument("-n", "--name", default="", help="Your name to find return addresses row")
     parser.add_argument("-r", "--ret", action="store_true", help="Include the same number of return address labels")
+    parser.add_argument("-s", "--shrink", action="store_true", help="Shrink the font of labels that don't fit")
     parser.add_argument("-t", "--test", action="store_true", help="Put box lines around each lablel")
+    parser.add_argument("--compact", action="store_true", help="Write a smaller pdf for big jobs and print its bytes per page, smallest with the canvas engine")
+    parser.add_argument("-e", "--engine", choices=ENGINES, default="pylabels", help="Rendering engine, canvas is faster")
+    parser.add_argument("-d", "--dedup", choices=DEDUP_MODES, default="off", help="Remove duplicate addresses, and with households merge two people at the same address into one label")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="Number of processes to read input sources and render pages with")
+    parser.add_argument("--batch", default="", help="A .toml or .json manifest of jobs to run on the input, loaded once")
+    parser.add_argument("-w", "--watch", action="store_true", help="Stay running, regenerating the pdf when the input changes and serving jobs locally")
+    parser.add_argument("--serve", action="store_true", help="Serve a local http api that renders posted addresses to pdfs, with --jobs worker processes")
+    parser.add_argument("--port", type=int, default=None, help="Local port the watch (default 8765) and serve (default 8766) modes listen on")
+    parser.add_argument("-p", "--page-cache", action="store_true", help="Reuse the rendered pages that didn't change since an earlier run")
+    parser.add_argument("--no-cache", dest="cache", action="store_false", help="Always parse the input instead of using the cache")
+    parser.add_argument("--check", nargs="?", const="", default=None, metavar="REPORT", help="Only check the selected rows for problems, optionally writing a .csv or .json report")
+    parser.add_argument("--stats-json", default="", help="Write the time, allocations and counts of each stage to a json file")
+    parser.add_argument("--profile", default="", help="Profile the run with cProfile and tracemalloc, saving the profile to this path")
     parser.add_argument("-l", "--launch", action="store_true", help="Launch the pdf in the browser")
     if defaults:
         return parser.parse_args([])
@@ -26,8 +47,48 @@ def get_args(defaults: bool = False) -> Namespace:
 
 def main():
     args = get_args()
-    label_generator = LabelGenerator(args)
-    label_generator.generate_pdf()
+    # Imported after the args are parsed, so help and arg errors don't wait for the rendering libraries
+    from label_generator import LabelGenerator
+    from batch import run_batch
+    from stats import RunStats, capture_profile
+    from validation import ERROR, print_report, report_format, validate, write_report
+    from watch import watch
+    from serve import serve
+
+    if args.batch:
+        # Fails scripts when a job failed, the rest still ran
+        if run_batch(args):
+            sys.exit(1)
+        return
+    if args.watch:
+        watch(args)
+        return
+    if args.serve:
+        serve(args)
+        return
+    if args.check:
+        # Before the input is loaded, so a bad path fails fast
+        report_format(args.check)
+    stats = RunStats()
+    issues = None
+    with capture_profile(args.profile, stats) if args.profile else nullcontext():
+        label_generator = LabelGenerator(args, stats=stats)
+        if args.check is None:
+            label_generator.generate_pdf()
+        else:
+            issues, rows = validate(label_generator)
+    if issues is not None:
+        print_report(issues, rows, verbose=not args.check)
+        if args.check:
+            write_report(issues, args.check)
+            print(f"Report saved to: {Path(args.check).resolve()}")
+    if args.profile or args.stats_json:
+        stats.print_summary()
+    if args.stats_json:
+        stats.write_json(args.stats_json)
+    # Fails scripts when rows would be skipped
+    if issues and any(issue.severity == ERROR for issue in issues):
+        sys.exit(1)
 
 
 if __name__ == "__main__":
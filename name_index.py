@@ -0,0 +1,188 @@
+from bisect import bisect_left, insort
+from collections import Counter
+from itertools import chain
+from address_table import AddressTable
+
+NAME_FIELDS = ("last_name1", "first_name1", "last_name2", "first_name2")
+
+# Kinds of name filter parts: 'smith', 'smi*' and '~smyth'
+EXACT = "exact"
+PREFIX = "prefix"
+FUZZY = "fuzzy"
+# Names longer than this can be 2 edits away for a fuzzy match, shorter ones 1
+FUZZY_LONG_NAME = 7
+
+
+def parse_name_part(part: str) -> tuple[str, str]:
+    """Returns the kind and lower cased name of a name filter part, raising ValueError if a prefix or fuzzy part isn't valid"""
+    name = part.strip().lower()
+    if name.endswith("*"):
+        kind, name = PREFIX, name[:-1]
+    elif name.startswith("~"):
+        kind, name = FUZZY, name[1:]
+    elif "*" in name or "~" in name:
+        raise ValueError(f"Not a valid name filter: {part}")
+    else:
+        return EXACT, name
+    if not name.isalpha():
+        raise ValueError(f"Not a valid name filter: {part}")
+    return kind, name
+
+
+def _trigrams(token: str) -> set[str]:
+    """Returns the trigrams of a token, padded so the start and end count"""
+    padded = f"$${token}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _edit_distance(a: str, b: str, limit: int) -> int:
+    """
+    Returns the Levenshtein distance between two strings, or limit + 1 once it's past the limit
+    Only the cells within limit of the diagonal can be under the limit, so only they are computed
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    over = limit + 1
+    previous = [min(j, over) for j in range(len(b) + 1)]
+    for i, ca in enumerate(a, 1):
+        start, end = max(1, i - limit), min(len(b), i + limit)
+        current = [over] * (len(b) + 1)
+        current[0] = min(i, over)
+        for j in range(start, end + 1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != b[j - 1]))
+        if min(current[start - 1:end + 1]) > limit:
+            return over
+        previous = current
+    return min(previous[-1], over)
+
+
+class NameIndex:
+    """
+    Inverted index from a lower cased name field to the sorted rows that contain it
+    Prefix and fuzzy parts look up the names in a trigram index of the names, built on first use
+    """
+
+    def __init__(self, table: AddressTable):
+        self.max_row = table.max_row
+        self.postings: dict[str, list[int]] = {}
+        self.trigrams: dict[str, list[str]] | None = None
+
+        # Row by row, so each posting list is built sorted and without duplicates
+        columns = [table.column(field) for field in NAME_FIELDS]
+        for i, values in enumerate(zip(*columns)):
+            tokens = {str(x).strip().lower() for x in values if x}
+            for token in tokens:
+                self.postings.setdefault(token, []).append(i + 2)
+
+    @staticmethod
+    def _tokens(columns: list[list], row: int) -> set[str]:
+        """Returns the lower cased name tokens of a row"""
+        return {str(column[row - 2]).strip().lower() for column in columns if column[row - 2]}
+
+    def update(self, old_table: AddressTable, new_table: AddressTable, rows: list[int]):
+        """Updates the postings of the changed rows in place. Both tables must have the same rows"""
+        old_columns = [old_table.column(field) for field in NAME_FIELDS]
+        new_columns = [new_table.column(field) for field in NAME_FIELDS]
+        for row in rows:
+            old_tokens = self._tokens(old_columns, row)
+            new_tokens = self._tokens(new_columns, row)
+            for token in old_tokens - new_tokens:
+                postings = self.postings[token]
+                del postings[bisect_left(postings, row)]
+                if not postings:
+                    del self.postings[token]
+                    # Rebuilt on the next prefix or fuzzy lookup
+                    self.trigrams = None
+            for token in new_tokens - old_tokens:
+                if token not in self.postings:
+                    self.trigrams = None
+                insort(self.postings.setdefault(token, []), row)
+
+    def _trigram_index(self) -> dict[str, list[str]]:
+        """Returns the index from a trigram to the names that contain it, building it if needed"""
+        if self.trigrams is None:
+            self.trigrams = {}
+            for token in self.postings:
+                for trigram in _trigrams(token):
+                    self.trigrams.setdefault(trigram, []).append(token)
+        return self.trigrams
+
+    def prefix_tokens(self, prefix: str) -> list[str]:
+        """Returns the names that start with the prefix"""
+        trigrams = self._trigram_index()
+        # Every name with the prefix has all of the prefix's trigrams except the one with the end padding
+        lists = [trigrams.get(trigram, []) for trigram in _trigrams(prefix) if not trigram.endswith("$")]
+        shortest = min(lists, key=len)
+        return [token for token in shortest if token.startswith(prefix)]
+
+    def fuzzy_tokens(self, name: str) -> list[tuple[str, int]]:
+        """
+        Returns the names within a few edits of a name, as (name, distance) ranked closest first
+        Candidates must share trigrams with the name, so the cost follows the similar names, not every name
+        """
+        limit = 2 if len(name) > FUZZY_LONG_NAME else 1
+        query = _trigrams(name)
+        # Each edit changes at most 3 trigrams. Short names still need one in common
+        threshold = max(1, len(query) - 3 * limit)
+
+        trigrams = self._trigram_index()
+        shared = Counter()
+        for trigram in query:
+            shared.update(trigrams.get(trigram, ()))
+
+        matches = []
+        for token, count in shared.most_common():
+            if count < threshold:
+                break
+            distance = _edit_distance(name, token, limit)
+            if distance <= limit:
+                matches.append((token, distance))
+        matches.sort(key=lambda match: match[1])
+        return matches
+
+    def _part_rows(self, part: str) -> list[int]:
+        """Returns the sorted rows a filter part matches"""
+        kind, name = parse_name_part(part)
+        if kind == EXACT:
+            return self.postings.get(name, [])
+        if kind == PREFIX:
+            tokens = self.prefix_tokens(name)
+        else:
+            tokens = [token for token, _ in self.fuzzy_tokens(name)]
+        if len(tokens) == 1:
+            return self.postings[tokens[0]]
+        # A row can have more than one of the names. Faster than merging the sorted lists when there are many
+        return sorted(set(chain.from_iterable(self.postings[token] for token in tokens)))
+
+    @staticmethod
+    def _contains(rows: list[int], row: int) -> bool:
+        """Binary search for a row in a sorted posting list"""
+        i = bisect_left(rows, row)
+        return i < len(rows) and rows[i] == row
+
+    def match(self, filter: str) -> set[int]:
+        """
+        Returns a set of all indices matched in the name fields
+        All parts in the split input filter, must match an address name field
+        """
+        return set(self.match_sorted(filter))
+
+    def match_sorted(self, filter: str) -> list[int]:
+        """Returns the same rows as match, as a sorted list"""
+        filter_parts = {x.strip().lower() for x in filter.split()}
+        if not filter_parts:
+            return list(range(2, self.max_row + 1))
+
+        posting_lists = []
+        for part in filter_parts:
+            rows = self._part_rows(part)
+            if not rows:
+                return []
+            posting_lists.append(rows)
+
+        # Walk the shortest list and look up the rest, so the cost follows the match count
+        posting_lists.sort(key=len)
+        shortest, others = posting_lists[0], posting_lists[1:]
+        if not others:
+            return list(shortest)
+        return [row for row in shortest if all(self._contains(rows, row) for rows in others)]
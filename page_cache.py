@@ -0,0 +1,54 @@
+import hashlib
+import os
+from pathlib import Path
+import platformdirs
+from address_table import Address
+from workbook_cache import evict_lru, write_entry
+
+# Same data dir as the GUI config
+CACHE_DIR = platformdirs.user_data_path("address_label_generator") / "page_cache"
+CACHE_SIZE_LIMIT = 256 * 1024 * 1024
+# Bump when the way labels are drawn changes, so old pages are never used
+CACHE_VERSION = 1
+
+
+class PageCache:
+    """
+    On disk cache of rendered pages, as single page PDFs
+    Pages are keyed by the labels on them and the render options, and evicted least recently used first
+    """
+
+    def __init__(self, cache_dir: Path = CACHE_DIR, size_limit: int = CACHE_SIZE_LIMIT):
+        self.cache_dir = Path(cache_dir)
+        self.size_limit = size_limit
+
+    @staticmethod
+    def key(labels: list[Address | None], options: str) -> str:
+        """Returns the key of a page from its labels in order, blank labels included, and the render options"""
+        content = repr((CACHE_VERSION, options, [tuple(label) if label is not None else None for label in labels]))
+        return hashlib.blake2b(content.encode(), digest_size=16).hexdigest()
+
+    def _entry_path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.pdf"
+
+    def load(self, key: str) -> Path | None:
+        """Returns the path of the cached page, or None if it's not cached"""
+        entry = self._entry_path(key)
+        try:
+            # Mark as recently used
+            os.utime(entry)
+        except FileNotFoundError:
+            return None
+        return entry
+
+    def store(self, key: str, data: bytes) -> Path:
+        """Caches a page PDF and returns its path"""
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        entry = self._entry_path(key)
+
+        write_entry(entry, lambda f: f.write(data))
+        return entry
+
+    def evict(self):
+        """Removes old pages until the cache fits in the size limit"""
+        evict_lru(self.cache_dir, "*.pdf", self.size_limit)
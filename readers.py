@@ -0,0 +1,251 @@
+import csv
+from itertools import repeat
+from pathlib import Path
+from typing import Callable, Iterator, NamedTuple
+from address_table import ADDRESS_COLUMN_COUNT, Address, AddressTable, SourceRows
+
+# Rows read between progress reports
+PROGRESS_ROWS = 1000
+# Picks every sheet of a workbook, like 'regions.xlsx:*'
+ALL_SHEETS = "*"
+
+# Reader functions by lower case file suffix. A reader lazily yields the raw row values, header included
+READERS: dict[str, Callable[[Path], Iterator[tuple]]] = {}
+# Suffixes of the files with sheets, their readers also take the sheet name
+SHEET_SUFFIXES: set[str] = set()
+
+
+class InputSource(NamedTuple):
+    """A sheet or file of the input. The name is the sheet name, or the file name without its suffix"""
+    name: str
+    path: Path
+    sheet: str | None = None
+
+
+def register_reader(*suffixes: str, sheets: bool = False):
+    """Registers a reader function for file suffixes like '.csv'. If sheets, it takes a sheet name as well"""
+    def register(func):
+        for suffix in suffixes:
+            READERS[suffix] = func
+            if sheets:
+                SHEET_SUFFIXES.add(suffix)
+        return func
+    return register
+
+
+def get_reader(path: Path) -> Callable[[Path], Iterator[tuple]]:
+    """Returns the reader for a file, by its suffix"""
+    reader = READERS.get(path.suffix.lower())
+    if reader is None:
+        supported = ", ".join(sorted(READERS))
+        raise ValueError(f"Unsupported file type: {path.suffix}. Supported types are: {supported}")
+    return reader
+
+
+@register_reader(".xlsx", sheets=True)
+def read_xlsx(path: Path, sheet: str | None = None) -> Iterator[tuple]:
+    """Streams the rows of a Worksheet of an Excel file, the active one if no sheet is given"""
+    # Slow to import, so only when an Excel file is read
+    from openpyxl import load_workbook
+
+    # Read only mode streams the rows instead of building every cell object
+    wb = load_workbook(path, read_only=True)
+    try:
+        if sheet is None:
+            ws = wb.active
+        elif sheet in wb.sheetnames:
+            ws = wb[sheet]
+        else:
+            raise ValueError(f"Sheet: '{sheet}' not found in '{path}'. Sheets are: {', '.join(wb.sheetnames)}")
+        yield from ws.iter_rows(values_only=True)
+    finally:
+        wb.close()
+
+
+def sheet_names(path: Path) -> list[str]:
+    """Returns the sheet names of an Excel file, in order"""
+    from openpyxl import load_workbook
+
+    wb = load_workbook(path, read_only=True)
+    try:
+        return list(wb.sheetnames)
+    finally:
+        wb.close()
+
+
+@register_reader(".csv", ".tsv")
+def read_csv(path: Path) -> Iterator[tuple]:
+    """Streams the rows of a comma or tab separated file. Empty fields are None, like empty Excel cells"""
+    delimiter = "\t" if path.suffix.lower() == ".tsv" else ","
+    # utf-8-sig drops the byte order mark Excel adds to CSV exports
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        for row in csv.reader(f, delimiter=delimiter):
+            yield tuple(value if value else None for value in row)
+
+
+def resolve_columns(columns: str, header: tuple | None) -> list[int | None]:
+    """
+    Returns the source column index of each Address field, None for a field that's always empty
+    Columns is a 'field=column' list like 'last_name1=Surname, zip=9', where the column is a header name or 1 based number
+    Fields not in the list keep their default column
+    """
+    indices = list(range(ADDRESS_COLUMN_COUNT))
+    for item in columns.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        field, sep, column = (x.strip() for x in item.partition("="))
+        if not sep or field not in Address._fields:
+            raise ValueError(f"Invalid column mapping: '{item}'. Fields are: {', '.join(Address._fields)}")
+
+        i = Address._fields.index(field)
+        if not column:
+            indices[i] = None
+        elif column.isdigit():
+            if int(column) < 1:
+                raise ValueError(f"Invalid column number: '{item}', columns start at 1")
+            indices[i] = int(column) - 1
+        else:
+            if header is None:
+                raise ValueError(f"Column '{column}' can't be found by name without a header")
+            names = [str(h).strip().lower() if h is not None else "" for h in header]
+            if column.lower() not in names:
+                raise ValueError(f"Column '{column}' not found in the header")
+            indices[i] = names.index(column.lower())
+    return indices
+
+
+def _report_rows(rows: Iterator[tuple], progress: Callable[[int], None]) -> Iterator[tuple]:
+    """Yields the rows, calling progress with the count read every PROGRESS_ROWS rows and at the end"""
+    count = 0
+    for count, row in enumerate(rows, 1):
+        if count % PROGRESS_ROWS == 0:
+            progress(count)
+        yield row
+    if count % PROGRESS_ROWS:
+        progress(count)
+
+
+def read_addresses(
+    path: Path,
+    header: bool = True,
+    columns: str = "",
+    progress: Callable[[int], None] | None = None,
+    sheet: str | None = None,
+) -> AddressTable:
+    """
+    Reads any supported file into an address table in a single streaming pass
+    Progress is called with the count of rows read so far, if it's given
+    The sheet is only for files with sheets, the active one is read if it's not given
+    """
+    reader = get_reader(path)
+    rows = reader(path) if sheet is None else reader(path, sheet)
+    try:
+        header_row = next(rows, None) if header else None
+        data_rows = _report_rows(rows, progress) if progress else rows
+        return AddressTable.from_rows(data_rows, resolve_columns(columns, header_row))
+    finally:
+        rows.close()
+
+
+def _split_input(input: str) -> list[tuple[Path, str | None]]:
+    """
+    Returns the (path, sheet) of each source in an input like 'regions.xlsx:west, regions.xlsx:east, extra.csv'
+    A single existing file is one source, even if its path has a comma
+    """
+    if Path(input).is_file():
+        return [(Path(input), None)]
+    items = []
+    for item in input.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        # Only a colon after a file name picks a sheet, not the one of a drive like 'C:'
+        path, sep, sheet = item.rpartition(":")
+        suffix = Path(path).suffix.lower()
+        if sep and suffix in READERS:
+            if suffix not in SHEET_SUFFIXES:
+                raise ValueError(f"Input: '{item}' picks a sheet, but only {', '.join(sorted(SHEET_SUFFIXES))} files have sheets")
+            items.append((Path(path.strip()), sheet.strip()))
+        else:
+            items.append((Path(item), None))
+    if not items:
+        raise ValueError("No input file given")
+    return items
+
+
+def input_paths(input: str) -> list[Path]:
+    """Returns the distinct files of an input, in order, without opening them"""
+    return list(dict.fromkeys(path for path, _ in _split_input(input)))
+
+
+def input_sources(input: str) -> list[InputSource]:
+    """
+    Returns the sources of an input, checking that each file exists and can be read
+    A sheet of '*' is every sheet of the workbook. Source names must be different, so filters can pick one
+    """
+    sources = []
+    for path, sheet in _split_input(input):
+        if not path.is_file():
+            raise FileNotFoundError(f"Input file not found at: {path}")
+        # Fails early on unsupported file types
+        get_reader(path)
+        if sheet == ALL_SHEETS:
+            sources.extend(InputSource(name, path, name) for name in sheet_names(path))
+        else:
+            sources.append(InputSource(sheet or path.stem, path, sheet))
+
+    names = [source.name.lower() for source in sources]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise ValueError(f"Input sources must have different names, these are repeated: {', '.join(duplicates)}")
+    return sources
+
+
+def resolve_input(input: str) -> str:
+    """Returns the input with absolute paths, for a process in another directory"""
+    items = _split_input(input)
+    if len(items) == 1 and items[0][1] is None:
+        return str(items[0][0].resolve())
+    return ", ".join(f"{path.resolve()}:{sheet}" if sheet else str(path.resolve()) for path, sheet in items)
+
+
+def _read_source(source: InputSource, header: bool, columns: str) -> AddressTable:
+    """Reads one source, in a worker process"""
+    return read_addresses(source.path, header, columns, sheet=source.sheet)
+
+
+def read_sources(
+    sources: list[InputSource],
+    header: bool = True,
+    columns: str = "",
+    jobs: int = 1,
+    progress: Callable[[int], None] | None = None,
+) -> AddressTable:
+    """
+    Reads the sources into one address table, with their rows one after another
+    With jobs and several sources, they're read at once in worker processes, and progress is called as each one finishes
+    The column mapping is resolved for each source, so their headers can be in different orders
+    """
+    if len(sources) == 1:
+        table = read_addresses(sources[0].path, header, columns, progress, sources[0].sheet)
+        table.sources = [SourceRows(sources[0].name, 2, table.max_row)]
+        return table
+
+    tables = []
+    read = 0
+    if jobs > 1:
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=min(jobs, len(sources))) as executor:
+            for table in executor.map(_read_source, sources, repeat(header), repeat(columns)):
+                tables.append(table)
+                read += table.max_row - 1
+                if progress:
+                    progress(read)
+    else:
+        for source in sources:
+            report = (lambda rows: progress(read + rows)) if progress else None
+            tables.append(read_addresses(source.path, header, columns, report, source.sheet))
+            read += tables[-1].max_row - 1
+    return AddressTable.concat([(source.name, table) for source, table in zip(sources, tables)])
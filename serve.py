@@ -0,0 +1,193 @@
+import contextlib
+import io
+import json
+import time
+from argparse import Namespace
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from address_table import AddressTable
+from label_generator import LabelGenerator
+from main import DEDUP_MODES, ENGINES
+
+# Only local processes can send requests, put a proxy in front to serve others
+HOST = "127.0.0.1"
+# Not the --watch port, so the GUI doesn't send its jobs here
+DEFAULT_PORT = 8766
+# Largest request body accepted
+MAX_BODY_BYTES = 64 * 1024 * 1024
+# Options a request can set, everything else is the server's
+REQUEST_OPTIONS = ("filter", "bias", "name", "ret", "shrink", "test", "compact", "engine", "dedup")
+CHOICES = {"engine": ENGINES, "dedup": DEDUP_MODES}
+# Warnings sent in the X-Warnings header, the rest are only counted
+MAX_HEADER_WARNINGS = 20
+# Distinct labels a worker keeps laid out between requests, before its caches are cleared
+WORKER_CACHE_LABELS = 100_000
+
+# The warm generator of a worker process, its label caches are shared by every request it renders
+_worker_generator: LabelGenerator | None = None
+
+
+def _init_worker(args: Namespace):
+    """Imports the rendering libraries and sets up the label caches once per worker, so requests start warm"""
+    global _worker_generator
+    # Only imported so the first request doesn't wait for them
+    import pylabels
+    import canvas_sheet
+
+    _worker_generator = LabelGenerator(args, AddressTable.empty())
+
+
+def render_request(args: Namespace, addresses: list) -> tuple[bytes, int, int, list[str]]:
+    """Renders the addresses to a PDF in a worker. Returns the PDF, label count, page count and warnings"""
+    label_generator = LabelGenerator.from_addresses(args, addresses)
+    if _worker_generator is not None:
+        if len(_worker_generator.layouts) > WORKER_CACHE_LABELS:
+            _init_worker(_worker_generator.args)
+        label_generator.templates = _worker_generator._template_cache()
+        label_generator.layouts = _worker_generator.layouts
+
+    # The warnings go back with the PDF instead of the server's output
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        stream = io.BytesIO()
+        label_count, page_count = label_generator.generate_pdf(stream)
+    warnings = [line for line in output.getvalue().splitlines() if line.startswith("Warning:")]
+    return stream.getvalue(), label_count, page_count, warnings
+
+
+def _address_value(value):
+    """Returns a json field value as the text the labels need. Numbers like a ZIP code are turned into text"""
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(int(value)) if isinstance(value, float) and value.is_integer() else str(value)
+    raise ValueError(f"Address values must be text, numbers or null, not: {json.dumps(value)}")
+
+
+def _parse_address(address) -> list | dict:
+    """Returns an address of the request with every value as text or None"""
+    if isinstance(address, list):
+        return [_address_value(value) for value in address]
+    if isinstance(address, dict):
+        return {field: _address_value(value) for field, value in address.items()}
+    raise ValueError(f"An address must be a list of the fields or an object of them, not: {json.dumps(address)}")
+
+
+def parse_request(args: Namespace, body: bytes) -> tuple[Namespace, list]:
+    """
+    Returns the args and addresses of a request body like {"addresses": [...], "options": {"engine": "canvas"}}
+    An address is a list of the fields in order or an object of them
+    """
+    try:
+        request = json.loads(body)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Invalid json: {e}")
+    if not isinstance(request, dict):
+        raise ValueError("The request must be a json object")
+    addresses = request.get("addresses")
+    if not isinstance(addresses, list):
+        raise ValueError("The request needs an 'addresses' list")
+    options = request.get("options", {})
+    if not isinstance(options, dict):
+        raise ValueError("The 'options' must be an object")
+
+    unknown = set(options) - set(REQUEST_OPTIONS)
+    if unknown:
+        raise ValueError(f"Unknown options: {', '.join(sorted(unknown))}. Options are: {', '.join(REQUEST_OPTIONS)}")
+    for key, value in options.items():
+        default = getattr(args, key)
+        if type(value) is not type(default):
+            raise ValueError(f"Option '{key}' must be a {type(default).__name__}")
+        if key in CHOICES and value not in CHOICES[key]:
+            raise ValueError(f"Option '{key}' must be one of: {', '.join(CHOICES[key])}")
+    # Each request renders serially, the requests themselves are parallel
+    return Namespace(**{**vars(args), **options, "jobs": 1, "page_cache": False, "launch": False}), [_parse_address(address) for address in addresses]
+
+
+class _LabelHandler(BaseHTTPRequestHandler):
+    """
+    POST /labels with a json body renders the addresses and replies with the PDF
+    The label and page counts and the warnings are in the X-Label-Count, X-Page-Count, X-Warning-Count and X-Warnings headers
+    GET /health replies once the server is up
+    """
+
+    def _send(self, status: int, content_type: str, body: bytes, headers: dict | None = None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status: int, message: str):
+        self._send(status, "application/json", json.dumps({"error": message}).encode())
+
+    def do_GET(self):
+        if self.path != "/health":
+            self._send_error(404, f"Not found: {self.path}")
+            return
+        self._send(200, "application/json", b'{"status": "ok"}')
+
+    def do_POST(self):
+        if self.path != "/labels":
+            self._send_error(404, f"Not found: {self.path}")
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        if length > MAX_BODY_BYTES:
+            self._send_error(413, f"The request is over {MAX_BODY_BYTES} bytes")
+            return
+
+        start = time.perf_counter()
+        try:
+            args, addresses = parse_request(self.server.args, self.rfile.read(length))
+            pdf, label_count, page_count, warnings = self.server.executor.submit(render_request, args, addresses).result()
+        except ValueError as e:
+            self._send_error(400, str(e))
+            return
+        except Exception as e:
+            self._send_error(500, str(e))
+            return
+        self._send(200, "application/pdf", pdf, {
+            "X-Label-Count": str(label_count),
+            "X-Page-Count": str(page_count),
+            "X-Warning-Count": str(len(warnings)),
+            "X-Warnings": json.dumps(warnings[:MAX_HEADER_WARNINGS]),
+            "X-Render-Seconds": f"{time.perf_counter() - start:.4f}",
+        })
+
+    def log_message(self, format: str, *args):
+        # Every request would be printed otherwise
+        pass
+
+
+class LabelServer(ThreadingHTTPServer):
+    """Serves label requests on a local port, rendered by a pool of warm worker processes"""
+
+    daemon_threads = True
+
+    def __init__(self, args: Namespace, port: int, workers: int):
+        super().__init__((HOST, port), _LabelHandler)
+        self.args = args
+        self.executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(args,))
+
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown(cancel_futures=True)
+
+
+def serve(args: Namespace):
+    """Serves label requests until Ctrl+C, with args.jobs worker processes. The args are the defaults of every request"""
+    workers = max(1, args.jobs)
+    port = args.port or DEFAULT_PORT
+    server = LabelServer(args, port, workers)
+    # Start the workers now, so the first requests don't wait for them
+    for future in [server.executor.submit(int) for _ in range(workers)]:
+        future.result()
+    print(f"Serving labels on http://{HOST}:{port}/labels with {workers} worker(s). Press Ctrl+C to stop")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
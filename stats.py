@@ -0,0 +1,104 @@
+import io
+import json
+import sys
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator
+
+# Functions printed from the profile and allocation sites kept from tracemalloc
+PROFILE_TOP = 20
+
+
+class RunStats:
+    """
+    Records the wall time, CPU time, allocations and item counts of each stage of a run,
+    and counters like the skipped and warned rows
+    """
+
+    def __init__(self):
+        self.stages: list[dict] = []
+        self.counters: Counter[str] = Counter()
+        self.extra: dict = {}
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[dict]:
+        """Times the block as a stage. Item counts can be set on the yielded dict"""
+        record = {"stage": name}
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+        blocks = sys.getallocatedblocks()
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield record
+        finally:
+            record["wall_seconds"] = time.perf_counter() - wall
+            # Only this process, not the workers of --jobs
+            record["cpu_seconds"] = time.process_time() - cpu
+            record["allocated_blocks"] = sys.getallocatedblocks() - blocks
+            if tracemalloc.is_tracing():
+                record["peak_traced_bytes"] = tracemalloc.get_traced_memory()[1]
+            self.stages.append(record)
+
+    def count(self, name: str, n: int = 1):
+        """Adds to a counter"""
+        self.counters[name] += n
+
+    def to_dict(self) -> dict:
+        return {
+            "stages": self.stages,
+            "counters": dict(self.counters),
+            "total_wall_seconds": sum(stage["wall_seconds"] for stage in self.stages),
+            "total_cpu_seconds": sum(stage["cpu_seconds"] for stage in self.stages),
+            **self.extra,
+        }
+
+    def write_json(self, path: str):
+        """Writes the stats as a json file"""
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=4, default=str)
+
+    def print_summary(self):
+        """Prints a line per stage"""
+        for stage in self.stages:
+            counts = "".join(f", {k}: {v}" for k, v in stage.items() if k in ("rows", "labels", "pages"))
+            print(f"{stage['stage']:>8}: {stage['wall_seconds']:.3f}s wall, {stage['cpu_seconds']:.3f}s cpu{counts}")
+        for name, value in sorted(self.counters.items()):
+            print(f"{name}: {value}")
+
+
+@contextmanager
+def capture_profile(path: str, stats: RunStats) -> Iterator[None]:
+    """
+    Runs the block under cProfile and tracemalloc
+    Writes the profile to path, for pstats or snakeviz, prints the slowest functions
+    and adds the top allocation sites to the stats
+    """
+    # Only needed when profiling
+    import cProfile
+    import pstats
+
+    profiler = cProfile.Profile()
+    tracemalloc.start()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        snapshot = tracemalloc.take_snapshot()
+        stats.extra["peak_traced_bytes"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        profiler.dump_stats(path)
+        output = io.StringIO()
+        pstats.Stats(profiler, stream=output).sort_stats("cumulative").print_stats(PROFILE_TOP)
+        print(output.getvalue())
+        print(f"Profile saved to: {Path(path).resolve()}")
+
+        stats.extra["top_allocations"] = [
+            {"site": str(stat.traceback), "bytes": stat.size, "blocks": stat.count}
+            for stat in snapshot.statistics("lineno")[:PROFILE_TOP]
+        ]
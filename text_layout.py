@@ -0,0 +1,115 @@
+import math
+from functools import lru_cache
+from typing import NamedTuple
+from reportlab.graphics import shapes
+from reportlab.pdfbase.pdfmetrics import stringWidth
+
+FONT_NAME = shapes.STATE_DEFAULTS["fontName"]
+FONT_SIZE = 10
+MIN_FONT_SIZE = 6
+FONT_SIZE_STEP = 0.5
+# Space between the top of a line and the baseline of the next
+LINE_GAP = 3
+# Widths to remember per font and size before starting over
+WIDTH_CACHE_SIZE = 100_000
+
+
+class FontMetrics:
+    """Metrics of a font at one size, caching the width of every string measured"""
+
+    def __init__(self, font_name: str, font_size: float):
+        self.font_name = font_name
+        self.font_size = font_size
+        self.widths: dict[str, float] = {}
+
+    def width(self, text: str) -> float:
+        """Returns the width of the text in points"""
+        w = self.widths.get(text)
+        if w is None:
+            if len(self.widths) >= WIDTH_CACHE_SIZE:
+                self.widths.clear()
+            w = stringWidth(text, self.font_name, self.font_size)
+            self.widths[text] = w
+        return w
+
+    def block_height(self, line_count: int) -> float:
+        """Returns the height of stacked lines, from the bottom baseline to the top of the last line"""
+        # Same sum as stacking each line on the top of the one below
+        y = 0
+        for _ in range(line_count - 1):
+            y = y + self.font_size + LINE_GAP
+        return y + self.font_size
+
+
+@lru_cache(maxsize=None)
+def font_metrics(font_name: str, font_size: float) -> FontMetrics:
+    """Returns the shared metrics for a font and size"""
+    return FontMetrics(font_name, font_size)
+
+
+class TextLayout(NamedTuple):
+    """Lines stacked bottom up, measured and centered in an area"""
+    lines: tuple[str, ...]
+    font_size: float
+    width: float
+    height: float
+    dx: float
+    dy: float
+
+    def to_group(self) -> shapes.Group:
+        """Builds the shapes of the layout"""
+        group = shapes.Group()
+        y = 0
+        for line in self.lines:
+            group.add(shapes.String(0, y, line, textAnchor="start", fontSize=self.font_size))
+            y = y + self.font_size + LINE_GAP
+        group.translate(self.dx, self.dy)
+        return group
+
+    def draw_on(self, canvas):
+        """Draws the layout straight onto a reportlab canvas"""
+        canvas.setFont(FONT_NAME, self.font_size)
+        y = 0
+        for line in self.lines:
+            canvas.drawString(self.dx, self.dy + y, line)
+            y = y + self.font_size + LINE_GAP
+
+    def draw_text_on(self, canvas):
+        """Draws the layout onto a canvas as one text object, which is smaller in the PDF than a string at a time"""
+        top = 0
+        for _ in self.lines[1:]:
+            top = top + self.font_size + LINE_GAP
+        text = canvas.beginText(self.dx, self.dy + top)
+        text.setFont(FONT_NAME, self.font_size, self.font_size + LINE_GAP)
+        # Stacked bottom up, but text lines move down
+        text.textLines(self.lines[::-1], trim=0)
+        canvas.drawText(text)
+
+
+def _fit_font_size(lines: tuple[str, ...], width: float, height: float, text_width: float) -> float:
+    """Returns the largest font size step that fits, since widths and heights scale linearly with it"""
+    n = len(lines)
+    fit = min(
+        FONT_SIZE * width / text_width if text_width else FONT_SIZE,
+        (height - (n - 1) * LINE_GAP) / n,
+    )
+    return max(MIN_FONT_SIZE, math.floor(fit / FONT_SIZE_STEP) * FONT_SIZE_STEP)
+
+
+def layout_text(lines: tuple[str, ...], width: float, height: float, shrink: bool = False) -> TextLayout:
+    """
+    Measures the lines with the cached font metrics and centers them in the area
+    If shrink, the font size is stepped down until the lines fit or reach the min size
+    """
+    metrics = font_metrics(FONT_NAME, FONT_SIZE)
+    text_width = max(metrics.width(line) for line in lines)
+    text_height = metrics.block_height(len(lines))
+
+    if shrink and (text_width > width or text_height > height):
+        metrics = font_metrics(FONT_NAME, _fit_font_size(lines, width, height, text_width))
+        text_width = max(metrics.width(line) for line in lines)
+        text_height = metrics.block_height(len(lines))
+
+    dx = (width - text_width) / 2
+    dy = (height - text_height) / 2
+    return TextLayout(lines, metrics.font_size, text_width, text_height, dx, dy)
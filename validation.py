@@ -0,0 +1,141 @@
+import csv
+import json
+from collections import Counter
+from pathlib import Path
+from typing import NamedTuple
+from address_table import Address
+from label_generator import LabelGenerator
+
+# The fields a row needs to be placed as a label, the same ones _iter_labels skips rows without
+REQUIRED_FIELDS = ("last_name1", "address1", "city", "state", "zip")
+NAME_FIELDS = ("last_name1", "first_name1", "last_name2", "first_name2")
+
+# Errors are rows that would be skipped, warnings are rows that would be placed but look wrong
+ERROR = "error"
+WARNING = "warning"
+REPORT_FIELDS = ("row", "severity", "kind", "name", "detail")
+REPORT_FORMATS = (".csv", ".json")
+
+
+class Issue(NamedTuple):
+    # The source and its row, like 'west:5', when the input has several
+    row: int | str
+    severity: str
+    kind: str
+    name: str
+    detail: str
+
+
+def _dropped_name_fields(address: Address) -> list[str]:
+    """Returns the name fields that are set but left out of the label by the name combination rules"""
+    if address.last_name1 and address.first_name1 and address.last_name2 and address.first_name2:
+        shown = NAME_FIELDS
+    elif address.last_name1 and address.first_name1 and address.first_name2:
+        shown = ("last_name1", "first_name1", "first_name2")
+    elif address.last_name1 and address.first_name1:
+        shown = ("last_name1", "first_name1")
+    else:
+        shown = ("last_name1",)
+    # A second last name that's the same as the first isn't lost
+    return [
+        field for field in NAME_FIELDS
+        if field not in shown and getattr(address, field) and getattr(address, field) != address.last_name1
+    ]
+
+
+def _display_name(address: Address) -> str:
+    return " ".join(str(address[i]) for i in (1, 0) if address[i])
+
+
+def validate(label_generator: LabelGenerator) -> tuple[list[Issue], int]:
+    """
+    Checks every selected row without rendering, in one pass over the table columns
+    Returns the rows that would be skipped and the labels that would overflow, sorted by row, and the count of rows checked
+    """
+    from text_layout import layout_text
+
+    indices, name_idx = label_generator._filter_indices()
+    table = label_generator.table
+    args = label_generator.args
+    rows = list(indices)
+    if args.ret and not args.name:
+        raise ValueError("Name must be set to use the ret option")
+    if args.ret:
+        rows.append(name_idx)
+
+    issues = []
+    with label_generator.stats.stage("check") as stage:
+        # Missing fields, a column at a time
+        missing: dict[int, list[str]] = {}
+        for field in REQUIRED_FIELDS:
+            column = table.column(field)
+            for row in rows:
+                if not column[row - 2]:
+                    missing.setdefault(row, []).append(field)
+
+        width, height = label_generator._label_area(label_generator._create_specification())
+        # Identical labels are measured once
+        layouts = {}
+        for row in rows:
+            address = table.get(row)
+            name = _display_name(address)
+            if row in missing:
+                if not any(address):
+                    issues.append(Issue(row, ERROR, "blank", "", "Blank row"))
+                else:
+                    issues.append(Issue(row, ERROR, "missing_fields", name, ", ".join(missing[row])))
+                continue
+
+            dropped = _dropped_name_fields(address)
+            if dropped:
+                detail = ", ".join(f"{field}={getattr(address, field)}" for field in dropped)
+                issues.append(Issue(row, WARNING, "ignored_name_fields", name, f"Not on the label: {detail}"))
+
+            lines, name = label_generator._format_address(address)
+            layout = layouts.get(lines)
+            if layout is None:
+                layout = layouts[lines] = layout_text(lines, width, height, shrink=args.shrink)
+            if layout.width > width:
+                issues.append(Issue(row, WARNING, "too_long", name, f"{layout.width:.1f}pt wide, the label fits {width:.1f}pt"))
+            if layout.height > height:
+                issues.append(Issue(row, WARNING, "too_tall", name, f"{layout.height:.1f}pt tall, the label fits {height:.1f}pt"))
+        stage["rows"] = len(rows)
+
+    # The return address row is checked last
+    issues.sort(key=lambda issue: issue.row)
+    if len(table.sources) > 1:
+        issues = [issue._replace(row=table.row_id(issue.row)) for issue in issues]
+    label_generator.stats.counters.update(issue.kind for issue in issues)
+    return issues, len(rows)
+
+
+def report_format(path: str) -> str:
+    """Returns the format of a report from its suffix"""
+    suffix = Path(path).suffix.lower()
+    if suffix not in REPORT_FORMATS:
+        raise ValueError(f"Report: '{path}' must be a .csv or .json file")
+    return suffix
+
+
+def write_report(issues: list[Issue], path: str):
+    """Writes the issues as a .csv or .json report"""
+    if report_format(path) == ".csv":
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(REPORT_FIELDS)
+            writer.writerows(issues)
+    else:
+        with open(path, "w") as f:
+            json.dump([issue._asdict() for issue in issues], f, indent=4)
+
+
+def print_report(issues: list[Issue], rows: int, verbose: bool = True):
+    """Prints the issues, if verbose, then the count of each kind"""
+    if verbose:
+        for issue in issues:
+            print(f"{issue.severity.capitalize()}: Row {issue.row} '{issue.name}': {issue.kind}, {issue.detail}")
+    counts = Counter(issue.kind for issue in issues)
+    skipped = len({issue.row for issue in issues if issue.severity == ERROR})
+    print(f"Checked {rows} row(s): {skipped} would be skipped, {len(issues)} issue(s)")
+    for kind, count in sorted(counts.items()):
+        print(f"{kind}: {count}")
@@ -0,0 +1,228 @@
+import json
+import socket
+import socketserver
+import threading
+import time
+from argparse import Namespace
+from pathlib import Path
+from typing import Callable
+from batch import BATCH_OPTIONS, merge_options
+from label_generator import GenerationCancelled, LabelGenerator
+from name_index import NameIndex
+from readers import input_paths, input_sources, resolve_input
+
+# Seconds between checks of the input files
+WATCH_INTERVAL = 0.5
+# Only local processes can send jobs
+HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+# Seconds between checks of the cancel event while waiting for the warm process
+CLIENT_POLL = 0.1
+
+
+def _input_key(args: Namespace) -> tuple:
+    """The options that decide how the input is loaded"""
+    return resolve_input(args.input), args.header, args.columns
+
+
+def fingerprint(paths: list[Path]) -> tuple[tuple[int, int], ...] | None:
+    """Returns the mtime and size of each file, or None if one is missing"""
+    stats = []
+    for path in paths:
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            return None
+        stats.append((stat.st_mtime_ns, stat.st_size))
+    return tuple(stats)
+
+
+class WarmEngine:
+    """
+    Keeps the input loaded, with its label layouts, and generates PDFs from it
+    When an input file changes the input is read again, but only the changed rows are reindexed
+    """
+
+    def __init__(self, args: Namespace):
+        self.args = args
+        self.lock = threading.Lock()
+        self._load(args)
+
+    def _load(self, args: Namespace):
+        """Loads an input from scratch, through the workbook cache"""
+        self.key = _input_key(args)
+        self.fingerprint = fingerprint(input_paths(args.input))
+        self.label_generator = LabelGenerator(args)
+
+    def _reload(self):
+        """Reads the changed input again, then updates the name index for only the rows that changed"""
+        old = self.label_generator
+        table = old._load_table(input_sources(self.args.input))
+        if table.max_row == old.table.max_row:
+            rows = old.table.changed_rows(table)
+            old.name_index.update(old.table, table, rows)
+            name_index = old.name_index
+            print(f"Input changed: {len(rows)} row(s) updated")
+        else:
+            # Rows were added or removed, so the rows after them all moved
+            name_index = NameIndex(table)
+            print(f"Input changed: {table.max_row - old.table.max_row:+} row(s), reindexed")
+        # The layouts and templates are keyed by label content, so they're still valid
+        self.label_generator = LabelGenerator(self.args, table, name_index)
+        self.label_generator.templates = old.templates
+        self.label_generator.layouts = old.layouts
+
+    def refresh(self) -> bool:
+        """Reloads the input if one of its files changed. Returns True if it did"""
+        files = fingerprint(input_paths(self.args.input))
+        if files is None or files == self.fingerprint:
+            return False
+        with self.lock:
+            try:
+                self._reload()
+            except Exception as e:
+                # Likely still being saved, so it's read again on the next check
+                print(f"Warning: Couldn't read the changed input: {e}")
+                return False
+            self.fingerprint = files
+        return True
+
+    def generate(
+        self,
+        args: Namespace,
+        progress: Callable[[str, int, int], None] | None = None,
+        cancel: threading.Event | None = None,
+    ) -> tuple[int, int]:
+        """Generates a PDF from the warm data, loading the input first if it's a different one"""
+        self.refresh()
+        with self.lock:
+            if _input_key(args) != self.key:
+                self._load(args)
+            self.args = args
+            return self.label_generator.with_args(args, progress, cancel).generate_pdf()
+
+
+class _JobHandler(socketserver.StreamRequestHandler):
+    """
+    Runs one job per connection. The request is a json line of options, the same as a batch job
+    The replies are json lines of progress, then a last line with the counts or the error
+    Closing the connection cancels the job
+    """
+
+    def _send(self, message: dict):
+        self.wfile.write(json.dumps(message).encode() + b"\n")
+
+    def handle(self):
+        engine: WarmEngine = self.server.engine
+        cancel = threading.Event()
+
+        def progress(stage: str, done: int, total: int):
+            try:
+                self._send({"progress": [stage, done, total]})
+            except OSError:
+                # The client went away
+                cancel.set()
+
+        try:
+            options = json.loads(self.rfile.readline())
+            args = merge_options(engine.args, options, "the job", allow_input=True)
+            label_count, page_count = engine.generate(args, progress, cancel)
+            self._send({"labels": label_count, "pages": page_count})
+        except GenerationCancelled:
+            print("Job cancelled")
+        except Exception as e:
+            print(e)
+            try:
+                self._send({"error": str(e)})
+            except OSError:
+                pass
+
+
+class JobServer(socketserver.ThreadingTCPServer):
+    """Serves jobs on a local port to the warm engine"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, engine: WarmEngine, port: int = DEFAULT_PORT):
+        super().__init__((HOST, port), _JobHandler)
+        self.engine = engine
+
+
+def watch(args: Namespace):
+    """
+    Generates the PDF, then keeps the process warm and generates it again whenever the input changes
+    Jobs with other options can also be sent on the local port, the last job is the one regenerated
+    """
+    engine = WarmEngine(args)
+    port = args.port or DEFAULT_PORT
+    server = JobServer(engine, port)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    engine.generate(args)
+    print(f"Watching '{args.input}' and serving jobs on {HOST}:{port}. Press Ctrl+C to stop")
+    try:
+        while True:
+            time.sleep(WATCH_INTERVAL)
+            if engine.refresh():
+                try:
+                    engine.generate(engine.args)
+                except Exception as e:
+                    print(e)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def _parse_message(line: bytes) -> dict:
+    """Returns a message of the warm process. Anything else, like the HTTP reply of --serve, means no warm process"""
+    try:
+        message = json.loads(line)
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        message = None
+    if not isinstance(message, dict) or not ({"progress", "error"} & message.keys() or {"labels", "pages"} <= message.keys()):
+        raise ConnectionRefusedError(f"No warm process on the port, it replied: {line[:80]!r}")
+    return message
+
+
+def send_job(
+    args: Namespace,
+    port: int | None = None,
+    progress: Callable[[str, int, int], None] | None = None,
+    cancel: threading.Event | None = None,
+) -> tuple[int, int]:
+    """
+    Sends a job to a warm process started with --watch. Returns the label and page count
+    Raises ConnectionRefusedError if no warm process is running, or something else answers on the port
+    """
+    options = {k: v for k, v in vars(args).items() if k not in BATCH_OPTIONS}
+    # The warm process may run in another directory
+    options["input"] = resolve_input(args.input)
+    options["output"] = str(Path(args.output).resolve())
+
+    with socket.create_connection((HOST, port or DEFAULT_PORT)) as sock:
+        sock.sendall(json.dumps(options).encode() + b"\n")
+        sock.settimeout(CLIENT_POLL)
+        buffer = b""
+        while True:
+            if cancel is not None and cancel.is_set():
+                raise GenerationCancelled("Generation cancelled")
+            try:
+                data = sock.recv(65536)
+            except socket.timeout:
+                continue
+            if not data:
+                raise ConnectionError("The warm process closed the connection")
+            buffer += data
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                message = _parse_message(line)
+                if "progress" in message:
+                    if progress is not None:
+                        progress(*message["progress"])
+                elif "error" in message:
+                    raise ValueError(message["error"])
+                else:
+                    return message["labels"], message["pages"]
@@ -0,0 +1,106 @@
+import hashlib
+import os
+import pickle
+import tempfile
+from pathlib import Path
+from typing import BinaryIO, Callable, Sequence
+import platformdirs
+from address_table import AddressTable
+from name_index import NameIndex
+
+# Same data dir as the GUI config
+CACHE_DIR = platformdirs.user_data_path("address_label_generator") / "workbook_cache"
+CACHE_SIZE_LIMIT = 512 * 1024 * 1024
+# Bump when the cached classes change, so old entries are never loaded
+CACHE_VERSION = 4
+
+
+class WorkbookCache:
+    """
+    On disk cache of parsed input files, as pickled (AddressTable, NameIndex) pairs
+    Entries are keyed by the file fingerprint and evicted least recently used first
+    """
+
+    def __init__(self, cache_dir: Path = CACHE_DIR, size_limit: int = CACHE_SIZE_LIMIT):
+        self.cache_dir = Path(cache_dir)
+        self.size_limit = size_limit
+
+    @staticmethod
+    def key(paths: Path | Sequence[Path], options: str = "") -> str:
+        """Returns the cache key of one or more files from their paths, mtimes, sizes, content hashes and the parse options"""
+        if isinstance(paths, (str, Path)):
+            paths = [paths]
+        files = []
+        for path in dict.fromkeys(Path(path).resolve() for path in paths):
+            stat = path.stat()
+            with open(path, "rb") as f:
+                content_hash = hashlib.file_digest(f, "blake2b").hexdigest()
+            files.append(f"{path}|{stat.st_mtime_ns}|{stat.st_size}|{content_hash}")
+        fingerprint = f"{CACHE_VERSION}|{'|'.join(files)}|{options}"
+        return hashlib.blake2b(fingerprint.encode(), digest_size=16).hexdigest()
+
+    def _entry_path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.pickle"
+
+    def load(self, key: str) -> tuple[AddressTable, NameIndex] | None:
+        """Returns the cached table and name index, or None if it's not cached"""
+        entry = self._entry_path(key)
+        try:
+            with open(entry, "rb") as f:
+                table, name_index = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception:
+            # Corrupt or from an incompatible version
+            entry.unlink(missing_ok=True)
+            return None
+
+        # Mark as recently used
+        os.utime(entry)
+        return table, name_index
+
+    def store(self, key: str, table: AddressTable, name_index: NameIndex):
+        """Caches a table and name index, then evicts old entries over the size limit"""
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        entry = self._entry_path(key)
+
+        write_entry(entry, lambda f: pickle.dump((table, name_index), f, protocol=pickle.HIGHEST_PROTOCOL))
+        self._evict()
+
+    def _evict(self):
+        """Removes the least recently used entries until the cache fits in the size limit"""
+        evict_lru(self.cache_dir, "*.pickle", self.size_limit)
+
+
+def write_entry(entry: Path, write: Callable[[BinaryIO], None]):
+    """
+    Writes a cache entry to a temporary file, then renames it so readers never see a partial entry
+    The temporary name is unique, so threads and processes storing the same entry at once don't collide
+    """
+    with tempfile.NamedTemporaryFile(dir=entry.parent, prefix=f".{entry.stem}.", suffix=".tmp", delete=False) as f:
+        tmp = Path(f.name)
+        try:
+            write(f)
+        except BaseException:
+            f.close()
+            tmp.unlink(missing_ok=True)
+            raise
+    os.replace(tmp, entry)
+
+
+def evict_lru(cache_dir: Path, pattern: str, size_limit: int):
+    """Removes the least recently used files matching the pattern until they fit in the size limit"""
+    entries = []
+    for entry in cache_dir.glob(pattern):
+        try:
+            stat = entry.stat()
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, entry))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, entry in sorted(entries, key=lambda e: e[0]):
+        if total <= size_limit:
+            break
+        entry.unlink(missing_ok=True)
+        total -= size